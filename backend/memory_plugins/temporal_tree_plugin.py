@@ -202,12 +202,15 @@ class TemporalTreePlugin(MemoryPluginBase):
             node = tree.nodes[memory_id]
             if "content" in updates:
                 node.content = updates["content"]
+                tree.reindex_memory(memory_id)
             if "importance" in updates:
                 node.base_importance = updates["importance"]
+                tree.refresh_importance(memory_id)
             if "emotion_tags" in updates:
                 node.emotion_tags = updates["emotion_tags"]
             if "topic_tags" in updates:
                 node.topic_tags = updates["topic_tags"]
+            tree.invalidate_views()
             self.manager.save()
             return True
         return False
@@ -0,0 +1,66 @@
+"""
+遗忘曲线的批量计算内核
+有 numba 时编译为并行机器码，否则用 numpy 整列运算
+
+本模块依赖 numpy，调用方应在 numpy 可用时才导入
+设置环境变量 MEMORY_NUMBA_CACHE=1 时把编译结果缓存到 __pycache__（安装目录需可写）
+"""
+
+import os
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba 为可选依赖
+    njit = None
+
+
+def _retention_numpy(
+    importance: np.ndarray,
+    mentions: np.ndarray,
+    emotions: np.ndarray,
+    days_elapsed: np.ndarray,
+    importance_factor: float,
+    repetition_factor: float,
+    min_strength: float
+) -> np.ndarray:
+    """按列计算保持率，公式与 ForgettingCurve.calculate_retention 相同"""
+    # float32 列先升为 float64 再计算，与 numba 版和逐条计算的精度一致
+    stability = (
+        1.0
+        + importance.astype(np.float64) * importance_factor
+        + np.log1p(mentions) * repetition_factor
+        + 0.1 * emotions
+    )
+    retention = np.maximum(min_strength, np.exp(-days_elapsed / (stability * 10)))
+    retention[days_elapsed <= 0] = 1.0
+    return retention
+
+
+if njit is not None:
+    # 不开 fastmath：结果须与纯Python路径一致
+    @njit(parallel=True, cache=os.environ.get("MEMORY_NUMBA_CACHE") == "1")
+    def retention_kernel(
+        importance, mentions, emotions, days_elapsed,
+        importance_factor, repetition_factor, min_strength
+    ):
+        """逐行计算保持率（numba 并行版）"""
+        n = importance.shape[0]
+        retention = np.empty(n, dtype=np.float64)
+        for i in prange(n):
+            days = days_elapsed[i]
+            if days <= 0:
+                retention[i] = 1.0
+                continue
+            stability = (
+                1.0
+                + importance[i] * importance_factor
+                + np.log1p(mentions[i]) * repetition_factor
+                + 0.1 * emotions[i]
+            )
+            value = np.exp(-days / (stability * 10))
+            retention[i] = value if value > min_strength else min_strength
+        return retention
+else:
+    retention_kernel = _retention_numpy
@@ -7,18 +7,20 @@
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
-from enum import Enum
-import json
+import asyncio
+import heapq
+import logging
 
-# 为了独立运行，这里重新定义必要的类型
-class EntityType(Enum):
-    USER = "user"
-    PERSON = "person"
-    PLACE = "place"
-    ORGANIZATION = "organization"
-    EVENT = "event"
-    CONCEPT = "concept"
-    OBJECT = "object"
+from schema.models import EntityType
+from schema.temporal_tree import epoch_seconds, epoch_day_key, effective_importance_array
+from schema.serialization import write_json_object
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，缺失时 get_event_columns 返回 None，不会用到
+    np = None
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -30,6 +32,9 @@ class ConsolidationConfig:
     daily_summary_max_length: int = 500
     enable_entity_extraction: bool = True
     enable_relationship_inference: bool = True
+    defer_daily_summaries: bool = False  # 每日摘要放到后台任务生成，consolidate 立即返回
+    summary_batch_size: int = 50         # 每日摘要分批提炼时每批的记忆数
+    summary_max_depth: int = 2           # 分批提炼的最大层数
 
 
 class MemoryConsolidator:
@@ -57,6 +62,8 @@ class MemoryConsolidator:
         self.config = config or ConsolidationConfig()
         self.llm_client = llm_client
         self.last_consolidation: Optional[datetime] = None
+        self._summary_tasks: List[asyncio.Task] = []  # 未完成的后台摘要任务（defer_daily_summaries）
+        self._summary_actions: List[Dict[str, Any]] = []  # 已完成任务生成的摘要动作，wait_for_summaries 取走
     
     def should_consolidate(self, current_time: Optional[datetime] = None) -> bool:
         """检查是否需要执行压缩"""
@@ -71,72 +78,220 @@ class MemoryConsolidator:
         now = current_time or datetime.now()
         report = {"timestamp": now.isoformat(), "actions": [], "stats": {}}
         
-        # 1. 更新所有记忆的强度
-        all_memories = list(self.memory_tree.nodes.values())
-        event_memories = [m for m in all_memories if m.time_grain == "event"]
-        self.forgetting_curve.batch_update_strengths(event_memories, now)
+        # 1. 更新所有记忆的强度（有列式视图时按列计算）
+        columns = self.memory_tree.get_event_columns()
+        event_memories = columns["rows"] if columns else self.memory_tree.get_event_memories()
+        strengths = self.forgetting_curve.batch_update_strengths(event_memories, now, columns)
         report["stats"]["total_memories"] = len(event_memories)
         
+        # 本轮的有效重要度只算一次（有 numpy 时按列计算），摘要排序和细节清理共用
+        importance_column = effective_importance_array(event_memories)
+        if importance_column is not None:
+            effective_importance = dict(zip([m.id for m in event_memories], importance_column.tolist()))
+        else:
+            effective_importance = {m.id: m.calculate_effective_importance() for m in event_memories}
+        
         # 2. 识别需要处理的记忆
         short_term_cutoff = now - timedelta(hours=self.config.short_term_retention_hours)
-        memories_to_consolidate = [
-            m for m in event_memories
-            if m.timestamp < short_term_cutoff and not m.is_consolidated
-        ]
+        if columns:
+            mask = (columns["timestamp_s"] < epoch_seconds(short_term_cutoff)) & ~columns["is_consolidated"]
+            selected = mask.nonzero()[0]
+            memories_to_consolidate = [event_memories[i] for i in selected.tolist()]
+        else:
+            memories_to_consolidate = [
+                m for m in event_memories
+                if m.timestamp < short_term_cutoff and not m.is_consolidated
+            ]
         report["stats"]["to_consolidate"] = len(memories_to_consolidate)
         
+        if columns:
+            # 清理掩码在让出事件循环（生成摘要）之前算好，各列都取自同一份行快照；
+            # 已压缩（含本轮将要标记的）不清理，条件整列合成一个掩码，只有命中的行回到Python层
+            strength_column = np.fromiter(
+                (m.current_strength for m in event_memories),
+                dtype=np.float64, count=len(event_memories)
+            )
+            cleanup_mask = (
+                ~(columns["is_consolidated"] | mask)
+                & (importance_column < self.config.min_importance_to_keep)
+                & (strength_column < 0.3)
+            )
+            to_clean = [event_memories[i] for i in np.flatnonzero(cleanup_mask).tolist()]
+        
         # 3. 按天分组并生成摘要
         days_processed = {}
-        for memory in memories_to_consolidate:
-            day_key = memory.timestamp.strftime("%Y-%m-%d")
-            if day_key not in days_processed:
-                days_processed[day_key] = []
-            days_processed[day_key].append(memory)
-        
-        for day_key, day_memories in days_processed.items():
-            summary = await self._generate_daily_summary(day_key, day_memories)
-            report["actions"].append({
-                "type": "daily_summary",
-                "day": day_key,
-                "summary": summary,
-                "memory_count": len(day_memories)
-            })
+        if columns:
+            # 按整数天序号分组，每个不同的天只格式化一次日期
+            day_ids = (columns["timestamp_s"][selected] // 86400).astype(np.int64).tolist()
+            by_day: Dict[int, List] = {}
+            for memory, day_id in zip(memories_to_consolidate, day_ids):
+                if day_id not in by_day:
+                    by_day[day_id] = []
+                by_day[day_id].append(memory)
+            for day_id, day_memories in by_day.items():
+                days_processed[epoch_day_key(day_id)] = day_memories
+        else:
+            for memory in memories_to_consolidate:
+                day_key = memory.day_key
+                if day_key not in days_processed:
+                    days_processed[day_key] = []
+                days_processed[day_key].append(memory)
+        
+        if self.config.defer_daily_summaries:
+            # 摘要（可能是LLM调用）在后台生成，结果通过 wait_for_summaries 获取
+            task = asyncio.create_task(self._summarize_days(days_processed, effective_importance))
+            task.add_done_callback(self._on_summary_done)
+            self._summary_tasks.append(task)
+            report["deferred"] = True
+        else:
+            report["actions"].extend(await self._summarize_days(days_processed, effective_importance))
         
         # 4. 标记已压缩
         for memory in memories_to_consolidate:
             memory.is_consolidated = True
         
         # 5. 清理低重要度记忆
-        cleaned = self._clean_low_importance_details(event_memories, now)
+        if columns:
+            cleaned = self._drop_raw_conversations(to_clean)
+        else:
+            cleaned = self._clean_low_importance_details(
+                event_memories, now, strengths, effective_importance
+            )
         report["stats"]["details_cleaned"] = cleaned
         
+        # 强度、压缩标记等已直接修改，树形视图缓存失效
+        self.memory_tree.invalidate_views()
+        
         self.last_consolidation = now
         return report
     
-    async def _generate_daily_summary(self, day_key: str, memories: List) -> str:
-        """生成每日摘要"""
+    async def _summarize_days(
+        self,
+        days_processed: Dict[str, List],
+        effective_importance: Optional[Dict[str, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        为每天生成摘要，返回摘要动作列表
+        
+        各天的摘要同时发起，换成LLM调用后由服务端合并成批处理，而不是逐天等待
+        """
+        summaries = await asyncio.gather(*(
+            self._generate_daily_summary(day_key, day_memories, effective_importance)
+            for day_key, day_memories in days_processed.items()
+        ))
+        return [
+            {
+                "type": "daily_summary",
+                "day": day_key,
+                "summary": summary,
+                "memory_count": len(day_memories)
+            }
+            for (day_key, day_memories), summary in zip(days_processed.items(), summaries)
+        ]
+    
+    def _on_summary_done(self, task: asyncio.Task):
+        """后台摘要任务结束：移出任务列表（释放其引用的记忆），收集结果，失败时记录日志"""
+        if task in self._summary_tasks:
+            self._summary_tasks.remove(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error("后台生成每日摘要失败", exc_info=error)
+            return
+        self._summary_actions.extend(task.result())
+    
+    async def wait_for_summaries(self) -> List[Dict[str, Any]]:
+        """等待所有后台摘要任务完成，返回此前未取走的摘要动作；失败的任务只记录日志"""
+        await asyncio.gather(*self._summary_tasks, return_exceptions=True)
+        actions, self._summary_actions = self._summary_actions, []
+        return actions
+    
+    async def _generate_daily_summary(
+        self,
+        day_key: str,
+        memories: List,
+        effective_importance: Optional[Dict[str, float]] = None
+    ) -> str:
+        """
+        生成每日摘要
+        
+        记忆较多时先分批并发提炼，再对各批结果汇总，
+        每层批次数按 summary_batch_size 递减，最多 summary_max_depth 层
+        
+        Args:
+            effective_importance: 本轮已算好的 {memory_id: 有效重要度}，缺省时现算
+        """
         if not memories:
             return ""
-        sorted_memories = sorted(
-            memories,
-            key=lambda m: m.calculate_effective_importance(),
-            reverse=True
-        )
-        top_contents = [m.content for m in sorted_memories[:5]]
+        batch_size = max(1, self.config.summary_batch_size)
+        depth = 0
+        while len(memories) > batch_size and depth < self.config.summary_max_depth:
+            batches = [memories[i:i + batch_size] for i in range(0, len(memories), batch_size)]
+            selected = await asyncio.gather(
+                *(self._summarize_batch(batch, effective_importance) for batch in batches)
+            )
+            memories = [m for batch in selected for m in batch]
+            depth += 1
+        
+        top_memories = await self._summarize_batch(memories, effective_importance)
+        top_contents = [m.content for m in top_memories]
         return "；".join(top_contents)[:self.config.daily_summary_max_length]
     
-    def _clean_low_importance_details(self, memories: List, current_time: datetime) -> int:
-        """清理低重要度记忆的详细内容"""
-        cleaned = 0
+    async def _summarize_batch(
+        self,
+        memories: List,
+        effective_importance: Optional[Dict[str, float]] = None
+    ) -> List:
+        """
+        提炼一批记忆，返回最能代表这批内容的记忆
+        
+        目前按有效重要度取前5条；批内顺序与原顺序一致，逐层提炼与整体取前5结果相同
+        """
+        if effective_importance is not None:
+            key = lambda m: effective_importance[m.id]
+        else:
+            key = lambda m: m.calculate_effective_importance()
+        sorted_memories = sorted(memories, key=key, reverse=True)
+        return sorted_memories[:5]
+    
+    def _clean_low_importance_details(
+        self,
+        memories: List,
+        current_time: datetime,
+        strengths: Optional[Dict[str, float]] = None,
+        effective_importance_by_id: Optional[Dict[str, float]] = None
+    ) -> int:
+        """
+        清理低重要度记忆的详细内容
+        
+        Args:
+            strengths / effective_importance_by_id: 本轮已算好的 {memory_id: 值}，缺省时现算
+        """
+        to_clean = []
         for memory in memories:
             if memory.is_consolidated:
                 continue
-            effective_importance = memory.calculate_effective_importance()
-            strength = self.forgetting_curve.calculate_retention(memory, current_time)
+            if effective_importance_by_id is not None:
+                effective_importance = effective_importance_by_id[memory.id]
+            else:
+                effective_importance = memory.calculate_effective_importance()
+            if strengths is not None:
+                strength = strengths[memory.id]
+            else:
+                strength = self.forgetting_curve.calculate_retention(memory, current_time)
             if effective_importance < self.config.min_importance_to_keep and strength < 0.3:
-                if hasattr(memory, 'raw_conversation') and memory.raw_conversation:
-                    memory.raw_conversation = None
-                    cleaned += 1
+                to_clean.append(memory)
+        return self._drop_raw_conversations(to_clean)
+    
+    @staticmethod
+    def _drop_raw_conversations(memories) -> int:
+        """丢弃记忆的原始对话，返回实际清理的条数"""
+        cleaned = 0
+        for memory in memories:
+            if hasattr(memory, 'raw_conversation') and memory.raw_conversation:
+                memory.raw_conversation = None
+                cleaned += 1
         return cleaned
 
 
@@ -153,31 +308,42 @@ class MemoryMigrator:
         snapshot = {
             "version": "1.0",
             "exported_at": datetime.now().isoformat(),
-            "memory_tree": memory_tree.to_dict(),
+            "memory_tree": memory_tree.to_dict(include_raw=include_raw_conversations),
             "knowledge_graph": knowledge_graph.to_dict()
         }
-        if not include_raw_conversations:
-            for node_data in snapshot["memory_tree"]["nodes"].values():
-                node_data.pop("raw_conversation", None)
         return snapshot
     
     @staticmethod
-    def export_to_file(memory_tree, knowledge_graph, filepath: str, **kwargs):
-        """导出到文件"""
-        snapshot = MemoryMigrator.export_memory_snapshot(memory_tree, knowledge_graph, **kwargs)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+    def export_to_file(
+        memory_tree,
+        knowledge_graph,
+        filepath: str,
+        include_raw_conversations: bool = False
+    ):
+        """
+        导出到文件
+        
+        内容与 export_memory_snapshot 相同，但记忆节点逐个序列化写出，
+        不在内存中先构建完整快照
+        """
+        with open(filepath, 'wb') as f:
+            write_json_object(f, [
+                ("version", "1.0"),
+                ("exported_at", datetime.now().isoformat()),
+                ("memory_tree", memory_tree.iter_dict_items(include_raw_conversations)),
+                ("knowledge_graph", knowledge_graph.to_dict()),
+            ])
     
     @staticmethod
     def generate_migration_summary(memory_tree, knowledge_graph) -> str:
         """生成迁移摘要"""
         lines = []
-        total_memories = sum(1 for n in memory_tree.nodes.values() if n.time_grain == "event")
+        total_memories = memory_tree.count_event_memories()
         lines.append(f"共有 {total_memories} 条记忆。")
         
-        if memory_tree.year_index:
-            years = sorted(memory_tree.year_index.keys())
-            lines.append(f"时间跨度: {years[0]} - {years[-1]}")
+        year_span = memory_tree.get_year_span()
+        if year_span:
+            lines.append(f"时间跨度: {year_span[0]} - {year_span[1]}")
         
         profile = knowledge_graph.user_profile
         if profile.name:
@@ -185,7 +351,7 @@ class MemoryMigrator:
         
         people = knowledge_graph.get_entities_by_type(EntityType.PERSON)
         if people:
-            important_people = sorted(people, key=lambda x: x.importance, reverse=True)[:5]
+            important_people = heapq.nlargest(5, people, key=lambda x: x.importance)
             names = [p.name for p in important_people]
             lines.append(f"重要人物: {', '.join(names)}")
         
@@ -3,12 +3,20 @@
 管理记忆的自然衰减和强化
 """
 
+import heapq
 import math
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
 from schema.models import MemoryNode
+from schema.temporal_tree import epoch_seconds
+
+try:
+    import numpy as np
+    from core._forgetting_kernels import retention_kernel
+except ImportError:  # numpy 为可选依赖，缺失时逐条计算
+    np = None
 
 
 @dataclass
@@ -58,6 +66,37 @@ class ForgettingCurve:
     
     def __init__(self, config: Optional[ForgettingConfig] = None):
         self.config = config or ForgettingConfig()
+        self.compile_config()
+    
+    def compile_config(self):
+        """
+        按当前配置生成常量内联的保持率函数
+        
+        配置在构造时固化到 _stability_fn / _retention_fn 和复习间隔表中；之后修改 self.config 需重新调用本方法
+        """
+        config = self.config
+        source = (
+            "def stability(base_importance, mention_count, emotion_count):\n"
+            "    return (1.0"
+            f" + base_importance * {config.importance_decay_factor!r}"
+            f" + log1p(mention_count) * {config.repetition_decay_factor!r}"
+            " + 0.1 * emotion_count)\n"
+            "def retention(stability, days_elapsed):\n"
+            "    if days_elapsed <= 0:\n"
+            "        return 1.0\n"
+            f"    return max({config.min_strength!r}, exp(-days_elapsed / (stability * 10)))\n"
+        )
+        namespace = {"exp": math.exp, "log1p": math.log1p}
+        exec(compile(source, "<ForgettingCurve.retention>", "exec"), namespace)
+        self._stability_fn = namespace["stability"]
+        self._retention_fn = namespace["retention"]
+        
+        # 复习间隔：标量查询用列表，批量查询用数组，下标上限预先算好
+        self._review_intervals = list(config.review_intervals)
+        self._max_interval_idx = len(self._review_intervals) - 1
+        self._review_intervals_np = (
+            np.asarray(self._review_intervals, dtype=np.int32) if np is not None else None
+        )
     
     def calculate_stability(self, memory: MemoryNode) -> float:
         """
@@ -69,18 +108,21 @@ class ForgettingCurve:
         2. 被提及次数
         3. 复习时机是否合理
         """
-        base_stability = 1.0
-        
-        # 重要度加成
-        importance_bonus = memory.base_importance * self.config.importance_decay_factor
-        
-        # 重复次数加成（边际效应递减）
-        repetition_bonus = math.log1p(memory.mention_count) * self.config.repetition_decay_factor
-        
-        # 情感强度加成（有情感标签的记忆更持久）
-        emotion_bonus = 0.1 * len(memory.emotion_tags)
-        
-        return base_stability + importance_bonus + repetition_bonus + emotion_bonus
+        # 结果按输入缓存在记忆上；键里带上计算函数，重新 compile_config 后自动失效
+        key = (
+            self._stability_fn,
+            memory.base_importance,
+            memory.mention_count,
+            len(memory.emotion_tags)
+        )
+        if memory._stability_key == key:
+            return memory._stability
+        
+        # 基础稳定性 1.0 + 重要度加成 + 重复次数加成（边际效应递减）+ 情感强度加成
+        stability = self._stability_fn(key[1], key[2], key[3])
+        memory._stability_key = key
+        memory._stability = stability
+        return stability
     
     def calculate_retention(
         self, 
@@ -99,16 +141,66 @@ class ForgettingCurve:
         last_reinforced = memory.last_mentioned or memory.created_at
         days_elapsed = (now - last_reinforced).total_seconds() / 86400
         
-        if days_elapsed <= 0:
-            return 1.0
+        # 艾宾浩斯公式（配置常量已内联）
+        return self._retention_fn(self.calculate_stability(memory), days_elapsed)
+    
+    def batch_calculate_retention(
+        self,
+        memories: List[MemoryNode],
+        current_time: Optional[datetime] = None,
+        columns: Optional[Dict[str, Any]] = None
+    ) -> List[float]:
+        """
+        批量计算记忆保持率，结果与逐条调用 calculate_retention 一致
         
-        # 计算稳定性
-        stability = self.calculate_stability(memory)
+        有 numpy 时只在Python层取一遍字段，保持率由 _forgetting_kernels 按列计算；
+        重要度列为 float32、次数列为 int32，与逐条结果的误差在 1e-7 以内
         
-        # 艾宾浩斯公式
-        retention = math.exp(-days_elapsed / (stability * 10))
+        Args:
+            columns: 与 memories 逐行对应的列式视图（TemporalMemoryTree.get_event_columns），
+                     提供时直接使用其中的字段列
         
-        return max(self.config.min_strength, retention)
+        Returns:
+            与 memories 一一对应的保持率列表
+        """
+        now = current_time or datetime.now()
+        retention = self._retention_array(memories, now, columns)
+        if retention is None:
+            return [self.calculate_retention(memory, now) for memory in memories]
+        return retention.tolist()
+    
+    def _retention_array(
+        self,
+        memories: List[MemoryNode],
+        now: datetime,
+        columns: Optional[Dict[str, Any]] = None
+    ):
+        """批量保持率的 ndarray 形式；没有 numpy 或 memories 为空时返回 None"""
+        if np is None or not memories:
+            return None
+        
+        config = self.config
+        if columns is not None:
+            importance = columns["importance"]
+            mentions = columns["mentions"]
+            emotions = columns["emotions"]
+            seconds = epoch_seconds(now) - columns["last_reinforced_s"]
+        else:
+            # 每个字段单独成列（一维浮点列表转数组比逐行元组快得多）
+            importance = np.array([memory.base_importance for memory in memories], dtype=np.float32)
+            mentions = np.array([memory.mention_count for memory in memories], dtype=np.int32)
+            emotions = np.array([len(memory.emotion_tags) for memory in memories], dtype=np.int32)
+            seconds = np.array([
+                (now - (memory.last_mentioned or memory.created_at)).total_seconds()
+                for memory in memories
+            ], dtype=np.float64)
+        
+        return retention_kernel(
+            importance, mentions, emotions, seconds / 86400,
+            config.importance_decay_factor,
+            config.repetition_decay_factor,
+            config.min_strength
+        )
     
     def update_memory_strength(
         self, 
@@ -134,6 +226,8 @@ class ForgettingCurve:
         """
         强化记忆（被提及时调用）
         
+        可能提高 base_importance；调用方需对记忆所在的时间树调用 refresh_importance
+        
         Returns:
             强化后的强度
         """
@@ -167,24 +261,34 @@ class ForgettingCurve:
         
         如果用户在"最佳复习时间"附近提及，说明这个记忆对用户重要
         """
-        if len(memory.mention_history) < 2:
+        history = memory.mention_history
+        if len(history) < 2:
             return
         
         # 计算平均复习间隔
-        intervals = []
-        sorted_history = sorted(memory.mention_history)
-        for i in range(1, len(sorted_history)):
-            interval = (sorted_history[i] - sorted_history[i-1]).days
-            intervals.append(interval)
-        
-        if not intervals:
-            return
+        # 上次统计覆盖了除最后一条外的全部历史，且新提及不早于已统计的最晚一次时，增量累加
+        if (
+            memory._prev_mention is not None
+            and memory._interval_count == len(history) - 2
+            and history[-1] >= memory._prev_mention
+        ):
+            memory._interval_sum += (history[-1] - memory._prev_mention).days
+            memory._interval_count += 1
+            memory._prev_mention = history[-1]
+        else:
+            sorted_history = sorted(history)
+            memory._interval_sum = sum(
+                (sorted_history[i] - sorted_history[i-1]).days
+                for i in range(1, len(sorted_history))
+            )
+            memory._interval_count = len(sorted_history) - 1
+            memory._prev_mention = sorted_history[-1]
         
-        avg_interval = sum(intervals) / len(intervals)
+        avg_interval = memory._interval_sum / memory._interval_count
         
         # 如果用户频繁提及（间隔小于理想间隔的一半），增加重要度
-        ideal_interval = self.config.review_intervals[
-            min(len(memory.mention_history) - 1, len(self.config.review_intervals) - 1)
+        ideal_interval = self._review_intervals[
+            min(len(memory.mention_history) - 1, self._max_interval_idx)
         ]
         
         if avg_interval < ideal_interval * 0.5:
@@ -194,17 +298,24 @@ class ForgettingCurve:
     def batch_update_strengths(
         self, 
         memories: List[MemoryNode],
-        current_time: Optional[datetime] = None
+        current_time: Optional[datetime] = None,
+        columns: Optional[Dict[str, Any]] = None
     ) -> Dict[str, float]:
         """
         批量更新记忆强度
         
+        Args:
+            columns: 可选的列式视图，见 batch_calculate_retention
+        
         Returns:
             {memory_id: new_strength}
         """
+        now = current_time or datetime.now()
         results = {}
-        for memory in memories:
-            new_strength = self.update_memory_strength(memory, current_time)
+        strengths = self.batch_calculate_retention(memories, now, columns)
+        for memory, new_strength in zip(memories, strengths):
+            memory.current_strength = new_strength
+            memory.updated_at = now
             results[memory.id] = new_strength
         return results
     
@@ -226,37 +337,58 @@ class ForgettingCurve:
         3. 正好处于"最佳复习时间"附近
         """
         now = current_time or datetime.now()
-        candidates = []
         
-        for memory in memories:
-            strength = self.calculate_retention(memory, now)
-            
-            # 太新或太弱的不考虑
-            if strength > 0.9 or strength < strength_threshold:
-                continue
-            
-            # 计算"复习紧迫度"
-            days_since_mention = (now - (memory.last_mentioned or memory.created_at)).days
-            review_count = len(memory.mention_history)
-            
-            # 根据复习次数确定理想间隔
-            ideal_interval = self.config.review_intervals[
-                min(review_count, len(self.config.review_intervals) - 1)
-            ]
-            
-            # 越接近理想间隔，紧迫度越高
-            urgency = 1.0 - abs(days_since_mention - ideal_interval) / ideal_interval
-            urgency = max(0, urgency)
+        # 太新或太弱的不考虑
+        retention = self._retention_array(memories, now)
+        if retention is not None:
+            # 整列比较筛出下标，命中的记忆只在Python层取字段，打分整列计算
+            keep = np.flatnonzero((retention <= 0.9) & (retention >= strength_threshold))
+            kept = [memories[i] for i in keep.tolist()]
+            if not kept:
+                return []
+            days_since_mention = np.array(
+                [(now - (m.last_mentioned or m.created_at)).days for m in kept], dtype=np.int64
+            )
+            review_counts = np.array([len(m.mention_history) for m in kept], dtype=np.int64)
+            importance = np.array([m.base_importance for m in kept], dtype=np.float64)
             
-            # 综合得分
-            score = urgency * memory.base_importance * (1 - strength)
+            # 根据复习次数确定理想间隔，越接近理想间隔紧迫度越高
+            ideal = self._review_intervals_np[np.minimum(review_counts, self._max_interval_idx)]
+            urgency = np.maximum(0.0, 1.0 - np.abs(days_since_mention - ideal) / ideal)
+            scores = (urgency * importance * (1 - retention[keep])).tolist()
             
-            candidates.append((memory, score))
+            # 堆上只保留 top_k 个，不对全部候选排序
+            best = heapq.nlargest(top_k, range(len(kept)), key=scores.__getitem__)
+            return [kept[i] for i in best]
         
-        # 按得分排序
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        
-        return [m for m, _ in candidates[:top_k]]
+        in_range = []
+        for memory in memories:
+            strength = self.calculate_retention(memory, now)
+            if strength_threshold <= strength <= 0.9:
+                in_range.append((memory, strength))
+        
+        def scored():
+            for memory, strength in in_range:
+                # 计算"复习紧迫度"
+                days_since_mention = (now - (memory.last_mentioned or memory.created_at)).days
+                review_count = len(memory.mention_history)
+                
+                # 根据复习次数确定理想间隔
+                ideal_interval = self._review_intervals[
+                    min(review_count, self._max_interval_idx)
+                ]
+                
+                # 越接近理想间隔，紧迫度越高
+                urgency = 1.0 - abs(days_since_mention - ideal_interval) / ideal_interval
+                urgency = max(0, urgency)
+                
+                # 综合得分
+                yield memory, urgency * memory.base_importance * (1 - strength)
+        
+        # 堆上只保留 top_k 个，不物化并排序全部候选
+        candidates = heapq.nlargest(top_k, scored(), key=lambda x: x[1])
+        
+        return [m for m, _ in candidates]
     
     def identify_fading_memories(
         self,
@@ -272,11 +404,15 @@ class ForgettingCurve:
         2. 决定是否需要压缩存储
         """
         now = current_time or datetime.now()
-        fading = []
         
+        retention = self._retention_array(memories, now)
+        if retention is not None:
+            # 整列比较得到下标，不逐条分支
+            return [memories[i] for i in np.flatnonzero(retention < threshold).tolist()]
+        
+        fading = []
         for memory in memories:
-            strength = self.calculate_retention(memory, now)
-            if strength < threshold:
+            if self.calculate_retention(memory, now) < threshold:
                 fading.append(memory)
         
         return fading
@@ -294,8 +430,23 @@ class ForgettingCurve:
             [(时间点, 预测强度), ...]
         """
         now = current_time or datetime.now()
-        forecast = []
         
+        if np is not None:
+            # 预测窗口内稳定性不变，只有经过天数随日期线性增长，一次整列计算
+            stability = self.calculate_stability(memory)
+            last_reinforced = memory.last_mentioned or memory.created_at
+            base_days = (now - last_reinforced).total_seconds() / 86400
+            future_days = base_days + np.arange(days_ahead + 1, dtype=np.float64)
+            retention = np.maximum(
+                self.config.min_strength, np.exp(-future_days / (stability * 10))
+            )
+            retention[future_days <= 0] = 1.0
+            return [
+                (now + timedelta(days=day), strength)
+                for day, strength in enumerate(retention.tolist())
+            ]
+        
+        forecast = []
         for day in range(days_ahead + 1):
             future_time = now + timedelta(days=day)
             predicted_strength = self.calculate_retention(memory, future_time)
@@ -315,8 +466,7 @@ class ForgettingCurve:
         review_count = len(memory.mention_history)
         
         # 根据复习次数选择间隔
-        interval_index = min(review_count, len(self.config.review_intervals) - 1)
-        ideal_interval = self.config.review_intervals[interval_index]
+        ideal_interval = self._review_intervals[min(review_count, self._max_interval_idx)]
         
         # 考虑重要度调整
         adjusted_interval = ideal_interval * (1 + (1 - memory.base_importance) * 0.5)
@@ -365,25 +515,23 @@ class ContextMemorySelector:
         4. 最近的记忆
         """
         now = current_time or datetime.now()
-        scored_memories = []
-        
-        for memory in all_memories:
-            # 计算当前强度
-            strength = self.forgetting_curve.calculate_retention(memory, now)
-            
-            # 强度太低的不考虑
-            if strength < self.min_strength_for_context:
-                continue
-            
-            # 计算综合得分
-            score = self._calculate_context_score(
-                memory, strength, current_topics, current_entities, now
-            )
-            scored_memories.append((memory, score))
         
-        # 排序并选择
-        scored_memories.sort(key=lambda x: x[1], reverse=True)
-        selected = [m for m, _ in scored_memories[:self.max_context_memories]]
+        # 批量计算当前强度
+        strengths = self.forgetting_curve.batch_calculate_retention(all_memories, now)
+        
+        # 强度太低的不考虑，其余按综合得分取前 max_context_memories 个
+        scored_memories = heapq.nlargest(
+            self.max_context_memories,
+            (
+                (memory, self._calculate_context_score(
+                    memory, strength, current_topics, current_entities, now
+                ))
+                for memory, strength in zip(all_memories, strengths)
+                if strength >= self.min_strength_for_context
+            ),
+            key=lambda x: x[1]
+        )
+        selected = [m for m, _ in scored_memories]
         
         return selected
     
@@ -437,7 +585,7 @@ class ContextMemorySelector:
         lines = ["[相关记忆]"]
         
         for memory in selected_memories:
-            timestamp_str = memory.timestamp.strftime("%Y-%m-%d")
+            timestamp_str = memory.day_key
             importance_indicator = "★" * int(memory.base_importance * 5)
             lines.append(f"- [{timestamp_str}] {memory.content} {importance_indicator}")
         
@@ -164,7 +164,10 @@ class MemoryManager:
         """强化记忆（被提及时调用）"""
         memory = self.memory_tree.get_memory(memory_id)
         if memory:
-            return self.forgetting_curve.reinforce_memory(memory)
+            strength = self.forgetting_curve.reinforce_memory(memory)
+            # 强化可能提高 base_importance
+            self.memory_tree.refresh_importance(memory_id)
+            return strength
         return 0.0
     
     # ==================== 记忆查询 ====================
@@ -224,10 +227,7 @@ class MemoryManager:
         
         # 如果没有任何条件，返回最近的记忆
         if not results and not any([query, time_hint, topic, entity_name]):
-            all_events = [
-                n for n in self.memory_tree.nodes.values() 
-                if n.time_grain == "event"
-            ]
+            all_events = self.memory_tree.get_event_memories()
             results = sorted(all_events, key=lambda x: x.timestamp, reverse=True)
         
         # 强化被搜索到的记忆
@@ -339,10 +339,7 @@ class MemoryManager:
         Returns:
             格式化的记忆字符串，可直接注入prompt
         """
-        all_events = [
-            n for n in self.memory_tree.nodes.values() 
-            if n.time_grain == "event"
-        ]
+        all_events = self.memory_tree.get_event_memories()
         
         selected = self.context_selector.select_for_context(
             all_events,
@@ -417,7 +414,7 @@ class MemoryManager:
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        all_events = [n for n in self.memory_tree.nodes.values() if n.time_grain == "event"]
+        all_events = self.memory_tree.get_event_memories()
         
         return {
             "total_memories": len(all_events),
@@ -4,11 +4,25 @@
 """
 
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Set, Tuple
-from collections import defaultdict
-import json
+from typing import Optional, List, Dict, Any, Set, Tuple, Iterator
+from collections import defaultdict, deque
+from operator import attrgetter
+import heapq
 
 from .models import Entity, Relationship, EntityType, RelationType, UserProfile
+from .serialization import save_json
+
+
+# 按重要度排序的键（比 lambda 少一层Python调用）
+_by_importance = attrgetter("importance")
+
+# 社交圈分组：关系类型 -> 圈子名称（其余归入 others）
+_SOCIAL_CIRCLES = {
+    RelationType.FAMILY: "family",
+    RelationType.FRIEND: "friends",
+    RelationType.COLLEAGUE: "colleagues",
+    RelationType.ROMANTIC: "romantic",
+}
 
 
 class KnowledgeGraph:
@@ -37,26 +51,65 @@ class KnowledgeGraph:
         
         # 索引
         self.name_index: Dict[str, str] = {}  # name/alias -> entity_id
+        self._name_trie: Dict[Any, Any] = {}  # 归一化名称/别名的前缀树，支持前缀查找
         self.type_index: Dict[EntityType, List[str]] = defaultdict(list)
         
         # 邻接表（快速查询关系）
+        # 懒构建：add_relationship 只登记到 _pending_rels，首次查询时由 _ensure_adj 统一建立
+        # 每条关系只记一次（source 的出边、target 的入边），双向关系在查询时对称处理
+        self._pending_rels: List[str] = []
         self.outgoing_edges: Dict[str, List[str]] = defaultdict(list)  # entity_id -> [rel_id]
         self.incoming_edges: Dict[str, List[str]] = defaultdict(list)  # entity_id -> [rel_id]
+        
+        # CSR邻接视图（图遍历热路径用，懒构建，增删实体/关系后失效）
+        self._csr_dirty = True
+        self._csr_index: Dict[str, int] = {}    # entity_id -> 行号
+        self._csr_ids: List[str] = []           # 行号 -> entity_id
+        self._csr_row_ptr: List[int] = [0]      # 行号 -> 该行在 col/rel 中的起始位置
+        self._csr_col: List[int] = []           # 边 -> 另一端行号
+        self._csr_rel: List[Relationship] = []  # 边 -> 关系
+        
+        # 实体对索引（O(1)查找两个实体之间的关系）
+        self._pair_index: Dict[Tuple[str, str], List[str]] = defaultdict(list)  # (source_id, target_id) -> [rel_id]
+        
+        # 实体出边按关系类型分桶（社交圈分组用），双向关系同时记在两端
+        self._relation_type_index: Dict[Tuple[str, RelationType], List[str]] = defaultdict(list)  # (entity_id, 关系类型) -> [rel_id]
+        
+        # 用户本人作为真实实体（ID固定为 "user"），社交圈和上下文摘要以它为中心
+        self._user_entity = Entity(
+            id="user",
+            name=self.user_profile.name or "用户",
+            entity_type=EntityType.USER
+        )
+        self.add_entity(self._user_entity)
     
     # ==================== 实体管理 ====================
     
+    @staticmethod
+    def _normalize(name: str) -> str:
+        """名称归一化，作为 name_index 的键"""
+        return name.lower()
+    
     def add_entity(self, entity: Entity) -> str:
         """添加实体"""
+        return self._add_entity(entity, self._normalize(entity.name))
+    
+    def _add_entity(self, entity: Entity, name_key: str) -> str:
+        """添加实体（名称已归一化）"""
         self.entities[entity.id] = entity
         
         # 更新名称索引
-        self.name_index[entity.name.lower()] = entity.id
+        self.name_index[name_key] = entity.id
+        self._trie_insert(name_key, entity.id)
         for alias in entity.aliases:
-            self.name_index[alias.lower()] = entity.id
+            alias_key = self._normalize(alias)
+            self.name_index[alias_key] = entity.id
+            self._trie_insert(alias_key, entity.id)
         
         # 更新类型索引
         self.type_index[entity.entity_type].append(entity.id)
         
+        self._csr_dirty = True
         return entity.id
     
     def get_entity(self, entity_id: str) -> Optional[Entity]:
@@ -65,26 +118,71 @@ class KnowledgeGraph:
     
     def find_entity_by_name(self, name: str) -> Optional[Entity]:
         """通过名称查找实体"""
-        entity_id = self.name_index.get(name.lower())
+        entity_id = self.name_index.get(self._normalize(name))
         if entity_id:
             return self.entities.get(entity_id)
         return None
     
+    def _trie_insert(self, key: str, entity_id: str):
+        """把名称键插入前缀树（None 键存放实体ID）"""
+        node = self._name_trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[None] = entity_id
+    
+    def find_entities_by_prefix(
+        self,
+        prefix: str,
+        limit: Optional[int] = None
+    ) -> List[Entity]:
+        """
+        通过名称/别名前缀查找实体
+        
+        只遍历前缀对应的子树，不扫描全部名称
+        """
+        node = self._name_trie
+        for ch in self._normalize(prefix):
+            node = node.get(ch)
+            if node is None:
+                return []
+        
+        results = []
+        seen = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            entity_id = node.get(None)
+            if entity_id is not None and entity_id not in seen:
+                seen.add(entity_id)
+                entity = self.entities.get(entity_id)
+                if entity:
+                    results.append(entity)
+                    if limit is not None and len(results) >= limit:
+                        break
+            # 逆序压栈，使出栈顺序与插入顺序一致（先序遍历）
+            stack.extend(reversed([child for key, child in node.items() if key is not None]))
+        
+        return results
+    
     def get_or_create_entity(
         self, 
         name: str, 
         entity_type: EntityType = EntityType.PERSON
     ) -> Entity:
         """获取或创建实体"""
-        existing = self.find_entity_by_name(name)
-        if existing:
-            return existing
+        # 只归一化一次，查找和建索引共用
+        name_key = self._normalize(name)
+        entity_id = self.name_index.get(name_key)
+        if entity_id:
+            existing = self.entities.get(entity_id)
+            if existing:
+                return existing
         
         entity = Entity(
             name=name,
             entity_type=entity_type
         )
-        self.add_entity(entity)
+        self._add_entity(entity, name_key)
         return entity
     
     def update_entity(
@@ -135,6 +233,16 @@ class KnowledgeGraph:
         # 更新重要度
         entity.importance = min(1.0, entity.importance + 0.02)
     
+    def _get_top_people(self, k: int) -> List[Entity]:
+        """
+        按重要度降序取前 k 个人物，同分时先加入者优先
+        
+        重要度可能被 update_entity 或直接赋值修改，每次按当前值选取，不维护增量结构
+        """
+        if k <= 0:
+            return []
+        return heapq.nlargest(k, self.get_entities_by_type(EntityType.PERSON), key=_by_importance)
+    
     def get_entities_by_type(self, entity_type: EntityType) -> List[Entity]:
         """获取指定类型的所有实体"""
         entity_ids = self.type_index.get(entity_type, [])
@@ -146,17 +254,28 @@ class KnowledgeGraph:
         """添加关系"""
         self.relationships[relationship.id] = relationship
         
-        # 更新邻接表
-        self.outgoing_edges[relationship.source_id].append(relationship.id)
-        self.incoming_edges[relationship.target_id].append(relationship.id)
-        
-        # 如果是双向关系，也添加反向边
-        if relationship.is_bidirectional:
-            self.outgoing_edges[relationship.target_id].append(relationship.id)
-            self.incoming_edges[relationship.source_id].append(relationship.id)
+        # 邻接表延迟到首次查询时建立
+        self._pending_rels.append(relationship.id)
         
+        self._csr_dirty = True
         return relationship.id
     
+    def _ensure_adj(self):
+        """把待处理的关系一次性写入邻接表和实体对索引"""
+        if not self._pending_rels:
+            return
+        
+        for rel_id in self._pending_rels:
+            relationship = self.relationships[rel_id]
+            self.outgoing_edges[relationship.source_id].append(rel_id)
+            self.incoming_edges[relationship.target_id].append(rel_id)
+            self._pair_index[(relationship.source_id, relationship.target_id)].append(rel_id)
+            self._relation_type_index[(relationship.source_id, relationship.relation_type)].append(rel_id)
+            if relationship.is_bidirectional and relationship.target_id != relationship.source_id:
+                self._relation_type_index[(relationship.target_id, relationship.relation_type)].append(rel_id)
+        
+        self._pending_rels.clear()
+    
     def get_relationship(self, rel_id: str) -> Optional[Relationship]:
         """获取关系"""
         return self.relationships.get(rel_id)
@@ -168,12 +287,18 @@ class KnowledgeGraph:
         relation_type: Optional[RelationType] = None
     ) -> Optional[Relationship]:
         """查找两个实体之间的关系"""
-        for rel_id in self.outgoing_edges.get(source_id, []):
+        self._ensure_adj()
+        for rel_id in self._pair_index.get((source_id, target_id), ()):
+            rel = self.relationships[rel_id]
+            if relation_type is None or rel.relation_type == relation_type:
+                return rel
+        
+        # 反方向登记的双向关系同样算作两者之间的关系
+        for rel_id in self._pair_index.get((target_id, source_id), ()):
             rel = self.relationships[rel_id]
-            if rel.target_id == target_id or \
-               (rel.is_bidirectional and rel.source_id == target_id):
-                if relation_type is None or rel.relation_type == relation_type:
-                    return rel
+            if rel.is_bidirectional and \
+               (relation_type is None or rel.relation_type == relation_type):
+                return rel
         return None
     
     def get_entity_relationships(
@@ -182,19 +307,87 @@ class KnowledgeGraph:
         direction: str = "both"  # "outgoing", "incoming", "both"
     ) -> List[Relationship]:
         """获取实体的所有关系"""
-        relations = []
+        self._ensure_adj()
         
-        if direction in ("outgoing", "both"):
-            for rel_id in self.outgoing_edges.get(entity_id, []):
-                relations.append(self.relationships[rel_id])
+        if direction == "outgoing":
+            return list(self._outgoing_rels(entity_id))
+        if direction == "incoming":
+            return list(self._incoming_rels(entity_id))
+        return [rel for rel, _ in self._adjacent_edges(entity_id)]
+    
+    def _outgoing_rels(self, entity_id: str) -> Iterator[Relationship]:
+        """实体的出边：以它为源的关系 + 以它为目标的双向关系"""
+        for rel_id in self.outgoing_edges.get(entity_id, ()):
+            yield self.relationships[rel_id]
+        for rel_id in self.incoming_edges.get(entity_id, ()):
+            rel = self.relationships[rel_id]
+            if rel.is_bidirectional and rel.source_id != entity_id:
+                yield rel
+    
+    def _incoming_rels(self, entity_id: str) -> Iterator[Relationship]:
+        """实体的入边：以它为目标的关系 + 以它为源的双向关系"""
+        for rel_id in self.incoming_edges.get(entity_id, ()):
+            yield self.relationships[rel_id]
+        for rel_id in self.outgoing_edges.get(entity_id, ()):
+            rel = self.relationships[rel_id]
+            if rel.is_bidirectional and rel.target_id != entity_id:
+                yield rel
+    
+    def _adjacent_edges(self, entity_id: str) -> Iterator[Tuple[Relationship, str]]:
+        """
+        从邻接表遍历实体的所有关系及另一端实体ID
         
-        if direction in ("incoming", "both"):
-            for rel_id in self.incoming_edges.get(entity_id, []):
-                rel = self.relationships[rel_id]
-                if rel not in relations:
-                    relations.append(rel)
+        先出边后入边；每条关系只登记一次，只有自环会同时出现在两边
+        """
+        for rel_id in self.outgoing_edges.get(entity_id, ()):
+            rel = self.relationships[rel_id]
+            yield rel, rel.target_id
+        for rel_id in self.incoming_edges.get(entity_id, ()):
+            rel = self.relationships[rel_id]
+            if rel.source_id != entity_id:
+                yield rel, rel.source_id
+    
+    def build_csr(self):
+        """
+        构建CSR（压缩稀疏行）邻接视图
         
-        return relations
+        每个实体分配一个行号，所有邻边平铺在一个列表中，
+        第 i 行的邻边为 _csr_col/_csr_rel[row_ptr[i]:row_ptr[i+1]]。
+        遍历时只做列表下标访问，不再查邻接表和关系字典。
+        """
+        self._ensure_adj()
+        ids = list(self.entities)
+        index = {entity_id: i for i, entity_id in enumerate(ids)}
+        # 关系端点可能不在实体表中（如外部直接写入的关系）
+        for edges in (self.outgoing_edges, self.incoming_edges):
+            for entity_id in edges:
+                if entity_id not in index:
+                    index[entity_id] = len(ids)
+                    ids.append(entity_id)
+        
+        row_ptr = [0]
+        col = []
+        rels = []
+        for entity_id in ids:
+            for rel, other_id in self._adjacent_edges(entity_id):
+                if other_id not in index:
+                    index[other_id] = len(ids)
+                    ids.append(other_id)
+                col.append(index[other_id])
+                rels.append(rel)
+            row_ptr.append(len(col))
+        
+        self._csr_index = index
+        self._csr_ids = ids
+        self._csr_row_ptr = row_ptr
+        self._csr_col = col
+        self._csr_rel = rels
+        self._csr_dirty = False
+    
+    def _ensure_csr(self):
+        """CSR视图失效时重建"""
+        if self._csr_dirty:
+            self.build_csr()
     
     def create_relationship_between(
         self,
@@ -241,39 +434,48 @@ class KnowledgeGraph:
         Returns:
             {entity_id: {"entity": Entity, "path": [关系路径], "depth": 深度}}
         """
-        result = {}
-        visited = {entity_id}
-        queue = [(entity_id, [], 0)]  # (entity_id, path, depth)
+        self._ensure_csr()
+        start = self._csr_index.get(entity_id)
+        if start is None:
+            return {}
+        ids, row_ptr, col, rels = self._csr_ids, self._csr_row_ptr, self._csr_col, self._csr_rel
+        # 类型过滤集合，每条边O(1)判断
+        type_filter = frozenset(relation_types) if relation_types else None
+        
+        # 在CSR行号上做BFS；只记录父指针，路径在返回前统一回溯
+        parent: Dict[int, Tuple[int, Relationship]] = {}
+        depths = {start: 0}
+        queue = deque([start])
         
         while queue:
-            current_id, path, depth = queue.pop(0)
+            current = queue.popleft()
+            depth = depths[current]
             
             if depth >= max_depth:
                 continue
             
-            for rel in self.get_entity_relationships(current_id):
+            for e in range(row_ptr[current], row_ptr[current + 1]):
+                rel = rels[e]
                 # 类型过滤
-                if relation_types and rel.relation_type not in relation_types:
+                if type_filter is not None and rel.relation_type not in type_filter:
                     continue
                 
-                # 找到另一端
-                other_id = rel.target_id if rel.source_id == current_id else rel.source_id
-                
-                if other_id in visited:
+                other = col[e]
+                if other in depths:
                     continue
                 
-                visited.add(other_id)
-                new_path = path + [rel]
-                
-                result[other_id] = {
-                    "entity": self.entities[other_id],
-                    "path": new_path,
-                    "depth": depth + 1
-                }
-                
-                queue.append((other_id, new_path, depth + 1))
+                depths[other] = depth + 1
+                parent[other] = (current, rel)
+                queue.append(other)
         
-        return result
+        return {
+            ids[other]: {
+                "entity": self.entities[ids[other]],
+                "path": self._build_path(parent, other),
+                "depth": depths[other]
+            }
+            for other in parent
+        }
     
     def find_path(
         self,
@@ -285,27 +487,81 @@ class KnowledgeGraph:
         if source_id == target_id:
             return []
         
-        visited = {source_id}
-        queue = [(source_id, [])]
+        self._ensure_csr()
+        source = self._csr_index.get(source_id)
+        target = self._csr_index.get(target_id)
+        if source is None or target is None:
+            return None
         
-        while queue:
-            current_id, path = queue.pop(0)
-            
-            if len(path) >= max_depth:
-                continue
-            
-            for rel in self.get_entity_relationships(current_id):
-                other_id = rel.target_id if rel.source_id == current_id else rel.source_id
-                
-                if other_id == target_id:
-                    return path + [rel]
-                
-                if other_id not in visited:
-                    visited.add(other_id)
-                    queue.append((other_id, path + [rel]))
+        # 双向BFS：每轮把较小的一侧扩展一整层，两侧相遇即得最短路径
+        parent_s: Dict[int, Optional[Tuple[int, Relationship]]] = {source: None}
+        parent_t: Dict[int, Optional[Tuple[int, Relationship]]] = {target: None}
+        frontier_s, frontier_t = [source], [target]
+        depth = 0  # 两侧已扩展层数之和，即当前可发现路径的长度
+        
+        while frontier_s and frontier_t and depth < max_depth:
+            depth += 1
+            if len(frontier_s) <= len(frontier_t):
+                frontier_s, meet = self._expand_frontier(frontier_s, parent_s, parent_t)
+            else:
+                frontier_t, meet = self._expand_frontier(frontier_t, parent_t, parent_s)
+            if meet is not None:
+                return self._trace(parent_s, meet)[::-1] + self._trace(parent_t, meet)
         
         return None
     
+    def _expand_frontier(
+        self,
+        frontier: List[int],
+        parent: Dict[int, Optional[Tuple[int, Relationship]]],
+        other_parent: Dict[int, Optional[Tuple[int, Relationship]]]
+    ) -> Tuple[List[int], Optional[int]]:
+        """
+        将一侧的BFS前沿扩展一层
+        
+        Returns:
+            (下一层前沿, 相遇点)；遇到对侧已访问的行号时立即返回它作为相遇点
+        """
+        row_ptr, col, rels = self._csr_row_ptr, self._csr_col, self._csr_rel
+        next_frontier = []
+        for current in frontier:
+            for e in range(row_ptr[current], row_ptr[current + 1]):
+                other = col[e]
+                if other in parent:
+                    continue
+                parent[other] = (current, rels[e])
+                if other in other_parent:
+                    return next_frontier, other
+                next_frontier.append(other)
+        return next_frontier, None
+    
+    @staticmethod
+    def _trace(
+        parent: Dict[int, Optional[Tuple[int, Relationship]]],
+        node: int
+    ) -> List[Relationship]:
+        """沿父指针从node走回该侧BFS起点，按经过顺序返回关系"""
+        path = []
+        step = parent[node]
+        while step is not None:
+            node, rel = step
+            path.append(rel)
+            step = parent[node]
+        return path
+    
+    @staticmethod
+    def _build_path(
+        parent: Dict[int, Tuple[int, Relationship]],
+        node: int
+    ) -> List[Relationship]:
+        """沿父指针回溯，重建从起点到node的关系路径"""
+        path = []
+        while node in parent:
+            node, rel = parent[node]
+            path.append(rel)
+        path.reverse()
+        return path
+    
     def infer_relationship(
         self,
         source_id: str,
@@ -329,12 +585,12 @@ class KnowledgeGraph:
         source = self.entities[source_id]
         target = self.entities[target_id]
         
-        descriptions = []
+        entities = self.entities
+        descriptions = [None] * len(path)
         current = source_id
-        for rel in path:
+        for i, rel in enumerate(path):
             other = rel.target_id if rel.source_id == current else rel.source_id
-            other_entity = self.entities[other]
-            descriptions.append(f"{rel.relation_type.value}→{other_entity.name}")
+            descriptions[i] = f"{rel.relation_type.value}→{entities[other].name}"
             current = other
         
         return f"{source.name} {'→'.join(descriptions)}"
@@ -347,14 +603,9 @@ class KnowledgeGraph:
         获取社交圈视图
         以用户或指定实体为中心
         """
-        # 如果未指定，以用户画像为中心
+        # 如果未指定，以用户本人为中心
         if center_id is None:
-            # 创建一个虚拟的用户实体
-            center_entity = Entity(
-                id="user",
-                name=self.user_profile.name or "用户",
-                entity_type=EntityType.USER
-            )
+            center_entity = self._user_entity
         else:
             center_entity = self.entities.get(center_id)
             if not center_entity:
@@ -369,6 +620,16 @@ class KnowledgeGraph:
             "others": []
         }
         
+        # 只查中心实体在各社交关系类型下的出边桶；同一人有多种关系时按 _SOCIAL_CIRCLES 顺序取第一个
+        self._ensure_adj()
+        center_key = center_id or self._user_entity.id
+        linked_circles: Dict[str, str] = {}
+        for relation_type, circle in _SOCIAL_CIRCLES.items():
+            for rel_id in self._relation_type_index.get((center_key, relation_type), ()):
+                rel = self.relationships[rel_id]
+                other_id = rel.target_id if rel.source_id == center_key else rel.source_id
+                linked_circles.setdefault(other_id, circle)
+        
         # 获取所有人物实体
         people = self.get_entities_by_type(EntityType.PERSON)
         
@@ -376,22 +637,7 @@ class KnowledgeGraph:
             if person.id == center_id:
                 continue
             
-            # 查找与中心的关系
-            rel = self.find_relationship(center_id or "user", person.id)
-            
-            if rel:
-                if rel.relation_type == RelationType.FAMILY:
-                    circles["family"].append(person)
-                elif rel.relation_type == RelationType.FRIEND:
-                    circles["friends"].append(person)
-                elif rel.relation_type == RelationType.COLLEAGUE:
-                    circles["colleagues"].append(person)
-                elif rel.relation_type == RelationType.ROMANTIC:
-                    circles["romantic"].append(person)
-                else:
-                    circles["others"].append(person)
-            else:
-                circles["others"].append(person)
+            circles[linked_circles.get(person.id, "others")].append(person)
         
         return {
             "center": center_entity.to_dict() if isinstance(center_entity, Entity) else None,
@@ -443,15 +689,32 @@ class KnowledgeGraph:
                 elif isinstance(current, list):
                     if isinstance(value, list):
                         current.extend(value)
-                        # 去重
-                        setattr(self.user_profile, key, list(set(current)))
+                        # 去重，保留原有顺序
+                        setattr(self.user_profile, key, list(dict.fromkeys(current)))
                     else:
                         current.append(value)
                 else:
                     setattr(self.user_profile, key, value)
         
+        # 用户改名时同步到用户实体（原名称仍可查到用户）
+        if updates.get("name"):
+            self._rename_user_entity(updates["name"])
+        
         self.user_profile.updated_at = datetime.now()
     
+    def _rename_user_entity(self, name: str):
+        """更新用户实体名称并登记新名称"""
+        entity = self._user_entity
+        if entity.name == name:
+            return
+        if entity.name not in entity.aliases:
+            entity.aliases.append(entity.name)
+        entity.name = name
+        name_key = self._normalize(name)
+        self.name_index[name_key] = entity.id
+        self._trie_insert(name_key, entity.id)
+        entity.updated_at = datetime.now()
+    
     def get_user_profile(self) -> Dict[str, Any]:
         """获取用户画像"""
         return self.user_profile.to_dict()
@@ -471,8 +734,7 @@ class KnowledgeGraph:
     
     def save(self, filepath: str):
         """保存到文件"""
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        save_json(self.to_dict(), filepath)
     
     def get_context_summary(self, max_entities: int = 10) -> str:
         """
@@ -491,17 +753,12 @@ class KnowledgeGraph:
             lines.append(f"当前状态: {profile.life_context}")
         
         # 重要人物
-        people = self.get_entities_by_type(EntityType.PERSON)
-        important_people = sorted(
-            people, 
-            key=lambda x: x.importance, 
-            reverse=True
-        )[:max_entities]
+        important_people = self._get_top_people(max_entities)
         
         if important_people:
             lines.append("\n重要人物:")
             for person in important_people:
-                rel = self.find_relationship("user", person.id)
+                rel = self.find_relationship(self._user_entity.id, person.id)
                 rel_desc = rel.description if rel else "提及过的人"
                 lines.append(f"  - {person.name}: {rel_desc}")
         
@@ -10,14 +10,74 @@ from enum import Enum
 import uuid
 
 
-class MemoryType(Enum):
+def make_to_dict(cls, field_specs, raw_specs=None):
+    """
+    为数据类生成专用的 to_dict 方法
+
+    field_specs / raw_specs: [(键名, 属性名, 类型)]，类型取值：
+      - None: 直接取属性
+      - "enum": 枚举，直接读 _value_，绕过 Enum.value 描述符
+      - "datetime": datetime，输出 isoformat()
+      - "optional_datetime": 可为空的 datetime
+      - "call": 调用无参方法
+    生成的函数体只有一个字典字面量，没有分支与反射；
+    给出 raw_specs 时生成 to_dict(include_raw=False)，这些字段仅在 include_raw 为真时输出
+    """
+    templates = {
+        None: "self.{0}",
+        "enum": "self.{0}._value_",
+        "datetime": "self.{0}.isoformat()",
+        "optional_datetime": "(self.{0}.isoformat() if self.{0} is not None else None)",
+        "call": "self.{0}()",
+    }
+    items = ",\n        ".join(
+        f"{key!r}: {templates[kind].format(attr)}"
+        for key, attr, kind in field_specs
+    )
+    if raw_specs:
+        raw_items = "".join(
+            f"\n        data[{key!r}] = {templates[kind].format(attr)}"
+            for key, attr, kind in raw_specs
+        )
+        source = (
+            f"def to_dict(self, include_raw=False):\n    data = {{\n        {items}\n    }}\n"
+            f"    if include_raw:{raw_items}\n    return data\n"
+        )
+    else:
+        source = f"def to_dict(self):\n    return {{\n        {items}\n    }}\n"
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, f"<{cls.__name__}.to_dict>", "exec"), namespace)
+    to_dict = namespace["to_dict"]
+    to_dict.__qualname__ = f"{cls.__name__}.to_dict"
+    to_dict.__module__ = cls.__module__
+    to_dict.__doc__ = "转换为字典"
+    to_dict.__annotations__ = {"return": Dict[str, Any]}
+    cls.to_dict = to_dict
+    return cls
+
+
+# 有效重要度中提及加成的上限；current_strength 不超过1，故有效重要度不超过 base_importance + 此值
+MAX_MENTION_BONUS = 0.3
+
+
+class _IdentityHashEnum(Enum):
+    """
+    按对象身份哈希的枚举基类
+
+    枚举成员是单例，相等即同一对象；默认的 Enum.__hash__ 是Python层函数，
+    换成 object.__hash__ 后作为字典键/集合元素时哈希走C实现
+    """
+    __hash__ = object.__hash__
+
+
+class MemoryType(_IdentityHashEnum):
     """记忆类型"""
     EPISODIC = "episodic"      # 情景记忆：具体事件
     SEMANTIC = "semantic"       # 语义记忆：抽象知识
     PROCEDURAL = "procedural"  # 程序记忆：习惯/偏好
 
 
-class EntityType(Enum):
+class EntityType(_IdentityHashEnum):
     """实体类型"""
     USER = "user"              # 用户本人
     PERSON = "person"          # 用户提到的人
@@ -28,7 +88,7 @@ class EntityType(Enum):
     OBJECT = "object"          # 物品
 
 
-class RelationType(Enum):
+class RelationType(_IdentityHashEnum):
     """关系类型"""
     # 人际关系
     FAMILY = "family"          # 家人
@@ -53,7 +113,7 @@ class RelationType(Enum):
     WANTS = "wants"            # 想要
 
 
-@dataclass
+@dataclass(slots=True)
 class MemoryNode:
     """
     记忆节点 - 时间树的基本单元
@@ -99,37 +159,100 @@ class MemoryNode:
     updated_at: datetime = field(default_factory=datetime.now)
     is_consolidated: bool = False        # 是否已被压缩
     
+    # 提及间隔的增量统计（遗忘曲线内部使用，不参与序列化）
+    _interval_sum: int = field(default=0, init=False, repr=False, compare=False)   # 相邻提及间隔天数之和
+    _interval_count: int = field(default=0, init=False, repr=False, compare=False)  # 已累计的间隔数
+    _prev_mention: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)  # 已累计的最晚提及时间
+    # 稳定性缓存（遗忘曲线内部使用）：输入不变时直接复用
+    _stability_key: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)  # (计算函数, 重要度, 提及次数, 情感数)
+    _stability: float = field(default=0.0, init=False, repr=False, compare=False)
+    # 子树内事件 base_importance 的最大值（时间层级节点上维护，只增不减，供视图剪枝）
+    _max_descendant_importance: float = field(default=0.0, init=False, repr=False, compare=False)
+    
+    # 日节点摘要的增量状态（TemporalMemoryTree 内部使用）
+    _top_events: Optional[list] = field(default=None, init=False, repr=False, compare=False)  # 最小堆 [(有效重要度, -子节点序号, 事件ID)]，至多3个
+    _summarized_children: int = field(default=0, init=False, repr=False, compare=False)     # 生成摘要时的子节点数
+    _summary_revision: int = field(default=-1, init=False, repr=False, compare=False)      # 生成摘要时所在树的修改次数
+    # 日期key / ISO时间缓存：记录生成时所用的 timestamp 对象，timestamp 被替换后重新格式化
+    _day_key: str = field(default="", init=False, repr=False, compare=False)
+    _day_key_source: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+    
+    _timestamp_iso: str = field(default="", init=False, repr=False, compare=False)
+    _timestamp_iso_source: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+    
+    # 时间层级节点的展示标签（如 "2024年01月"），由 TemporalMemoryTree 创建节点时写入
+    _label: str = field(default="", init=False, repr=False, compare=False)
+    
+    # 小写文本缓存（内容搜索用）：记录生成时所用的字符串对象，字段被重新赋值后重新转换
+    _content_lc: str = field(default="", init=False, repr=False, compare=False)
+    _content_lc_source: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _detail_lc: str = field(default="", init=False, repr=False, compare=False)
+    _detail_lc_source: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def content_lc(self) -> str:
+        """content 的小写形式，首次访问时转换并缓存"""
+        if self._content_lc_source is not self.content:
+            self._content_lc = self.content.lower()
+            self._content_lc_source = self.content
+        return self._content_lc
+    
+    @property
+    def detail_lc(self) -> str:
+        """detail 的小写形式（detail 为空时为空串），首次访问时转换并缓存"""
+        if self._detail_lc_source is not self.detail:
+            self._detail_lc = self.detail.lower() if self.detail else ""
+            self._detail_lc_source = self.detail
+        return self._detail_lc
+    
+    @property
+    def day_key(self) -> str:
+        """所属日期的key（"YYYY-MM-DD"），首次访问时格式化并缓存"""
+        if self._day_key_source is not self.timestamp:
+            self._day_key = self.timestamp.strftime("%Y-%m-%d")
+            self._day_key_source = self.timestamp
+        return self._day_key
+    
+    @property
+    def timestamp_iso(self) -> str:
+        """timestamp.isoformat()，首次访问时格式化并缓存"""
+        if self._timestamp_iso_source is not self.timestamp:
+            self._timestamp_iso = self.timestamp.isoformat()
+            self._timestamp_iso_source = self.timestamp
+        return self._timestamp_iso
+    
     def calculate_effective_importance(self) -> float:
         """
         计算有效重要度
         综合考虑：基础重要度 × 当前强度 + 提及频率加成
         """
-        mention_bonus = min(0.3, self.mention_count * 0.05)  # 提及加成，最高0.3
+        mention_bonus = min(MAX_MENTION_BONUS, self.mention_count * 0.05)  # 提及加成，最高0.3
         return min(1.0, self.base_importance * self.current_strength + mention_bonus)
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
-        return {
-            "id": self.id,
-            "timestamp": self.timestamp.isoformat(),
-            "time_grain": self.time_grain,
-            "content": self.content,
-            "detail": self.detail,
-            "memory_type": self.memory_type.value,
-            "emotion_tags": self.emotion_tags,
-            "topic_tags": self.topic_tags,
-            "base_importance": self.base_importance,
-            "current_strength": self.current_strength,
-            "mention_count": self.mention_count,
-            "last_mentioned": self.last_mentioned.isoformat() if self.last_mentioned else None,
-            "parent_id": self.parent_id,
-            "children_ids": self.children_ids,
-            "linked_entities": self.linked_entities,
-            "effective_importance": self.calculate_effective_importance()
-        }
 
 
-@dataclass
+make_to_dict(MemoryNode, [
+    ("id", "id", None),
+    ("timestamp", "timestamp_iso", None),
+    ("time_grain", "time_grain", None),
+    ("content", "content", None),
+    ("detail", "detail", None),
+    ("memory_type", "memory_type", "enum"),
+    ("emotion_tags", "emotion_tags", None),
+    ("topic_tags", "topic_tags", None),
+    ("base_importance", "base_importance", None),
+    ("current_strength", "current_strength", None),
+    ("mention_count", "mention_count", None),
+    ("last_mentioned", "last_mentioned", "optional_datetime"),
+    ("parent_id", "parent_id", None),
+    ("children_ids", "children_ids", None),
+    ("linked_entities", "linked_entities", None),
+    ("effective_importance", "calculate_effective_importance", "call"),
+], raw_specs=[
+    ("raw_conversation", "raw_conversation", None),
+])
+
+
+@dataclass(slots=True)
 class Entity:
     """
     实体 - 图谱的节点
@@ -171,21 +294,21 @@ class Entity:
     # 元数据
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
-    
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "name": self.name,
-            "aliases": self.aliases,
-            "entity_type": self.entity_type.value,
-            "attributes": self.attributes,
-            "sentiment": self.sentiment,
-            "importance": self.importance,
-            "mention_count": self.mention_count
-        }
 
 
-@dataclass
+make_to_dict(Entity, [
+    ("id", "id", None),
+    ("name", "name", None),
+    ("aliases", "aliases", None),
+    ("entity_type", "entity_type", "enum"),
+    ("attributes", "attributes", None),
+    ("sentiment", "sentiment", None),
+    ("importance", "importance", None),
+    ("mention_count", "mention_count", None),
+])
+
+
+@dataclass(slots=True)
 class Relationship:
     """
     关系 - 图谱的边
@@ -225,22 +348,22 @@ class Relationship:
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
     confidence: float = 1.0              # 置信度
-    
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "id": self.id,
-            "source_id": self.source_id,
-            "target_id": self.target_id,
-            "relation_type": self.relation_type.value,
-            "description": self.description,
-            "attributes": self.attributes,
-            "sentiment": self.sentiment,
-            "is_bidirectional": self.is_bidirectional,
-            "confidence": self.confidence
-        }
 
 
-@dataclass
+make_to_dict(Relationship, [
+    ("id", "id", None),
+    ("source_id", "source_id", None),
+    ("target_id", "target_id", None),
+    ("relation_type", "relation_type", "enum"),
+    ("description", "description", None),
+    ("attributes", "attributes", None),
+    ("sentiment", "sentiment", None),
+    ("is_bidirectional", "is_bidirectional", None),
+    ("confidence", "confidence", None),
+])
+
+
+@dataclass(slots=True)
 class UserProfile:
     """
     用户画像 - 特殊的实体，有更丰富的结构
@@ -315,7 +438,7 @@ class UserProfile:
         }
 
 
-@dataclass 
+@dataclass(slots=True)
 class ConversationContext:
     """
     对话上下文 - 工作记忆
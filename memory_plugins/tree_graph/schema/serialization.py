@@ -0,0 +1,63 @@
+"""
+JSON 序列化工具
+安装了 orjson 时使用其C实现，否则回退到标准库 json
+"""
+
+import json
+from collections.abc import Iterator
+from typing import Any, BinaryIO, Iterable, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+def save_json(data: Any, filepath: str, indent: bool = True):
+    """
+    将数据写入JSON文件
+    
+    Args:
+        data: 可序列化的数据
+        filepath: 文件路径
+        indent: 是否缩进（2空格）
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(data, option=option))
+    else:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2 if indent else None)
+
+
+def dumps_json(data: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def write_json_object(f: BinaryIO, items: Iterable[Tuple[str, Any]]):
+    """
+    逐项写出一个JSON对象，不需要先在内存中拼出完整的字典
+    
+    Args:
+        f: 以二进制模式打开的文件
+        items: (键, 值) 序列；值为迭代器（如生成器）时视为 (键, 值) 序列递归流式写出
+    """
+    f.write(b"{")
+    first = True
+    for key, value in items:
+        if not first:
+            f.write(b", ")
+        first = False
+        f.write(dumps_json(key))
+        f.write(b": ")
+        if isinstance(value, Iterator):
+            write_json_object(f, value)
+        else:
+            f.write(dumps_json(value))
+    f.write(b"}")
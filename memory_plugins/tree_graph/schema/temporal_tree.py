@@ -4,11 +4,131 @@
 """
 
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from collections import defaultdict
+from functools import lru_cache, wraps
+import bisect
+import heapq
+import itertools
 import json
+import re
+import threading
 
-from .models import MemoryNode, MemoryType
+from .models import MemoryNode, MemoryType, MAX_MENTION_BONUS
+from .serialization import write_json_object
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，缺失时不提供列式视图
+    np = None
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_seconds(dt: datetime) -> float:
+    """
+    datetime 转为相对 1970-01-01 的秒数（与 datetime 比较顺序一致）
+    
+    naive 时间按墙上时间直接相减；带时区的时间（如 load 时解析出的带偏移量字符串）取 UTC 时间戳
+    """
+    if dt.tzinfo is not None and dt.utcoffset() is not None:
+        return dt.timestamp()
+    return (dt - _EPOCH).total_seconds()
+
+
+@lru_cache(maxsize=4096)
+def epoch_day_key(day: int) -> str:
+    """epoch_seconds // 86400 得到的天序号转回 "YYYY-MM-DD"；按天序号缓存，不再逐次构造 datetime"""
+    return (_EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+
+
+def _whole_day(day: datetime) -> Tuple[datetime, datetime]:
+    """某一天的 00:00:00 到 23:59:59"""
+    return datetime(day.year, day.month, day.day), \
+           datetime(day.year, day.month, day.day, 23, 59, 59)
+
+
+def _hint_yesterday(ref: datetime) -> Tuple[datetime, datetime]:
+    return _whole_day(ref - timedelta(days=1))
+
+
+def _hint_day_before_yesterday(ref: datetime) -> Tuple[datetime, datetime]:
+    return _whole_day(ref - timedelta(days=2))
+
+
+def _hint_last_week(ref: datetime) -> Tuple[datetime, datetime]:
+    start = ref - timedelta(days=ref.weekday() + 7)
+    return start, start + timedelta(days=6)
+
+
+def _hint_last_month(ref: datetime) -> Tuple[datetime, datetime]:
+    last_month_end = datetime(ref.year, ref.month, 1) - timedelta(days=1)
+    return datetime(last_month_end.year, last_month_end.month, 1), last_month_end
+
+
+def _hint_last_year(ref: datetime) -> Tuple[datetime, datetime]:
+    return datetime(ref.year - 1, 1, 1), datetime(ref.year - 1, 12, 31)
+
+
+# 时间提示词 -> 解析函数；同一提示中出现多个词时，本表中靠前的优先
+_TIME_HINT_DISPATCH = {
+    "昨天": _hint_yesterday,
+    "昨晚": _hint_yesterday,
+    "前天": _hint_day_before_yesterday,
+    "上周": _hint_last_week,
+    "上个月": _hint_last_month,
+    "上月": _hint_last_month,
+    "去年": _hint_last_year,
+}
+_TIME_HINT_PRIORITY = {
+    handler: rank
+    for rank, handler in enumerate(dict.fromkeys(_TIME_HINT_DISPATCH.values()))
+}
+_TIME_HINT_RE = re.compile("|".join(map(re.escape, _TIME_HINT_DISPATCH)))
+
+
+@lru_cache(maxsize=4096)
+def _iso_week(year: int, month: int, day: int) -> int:
+    """某一天的ISO周数；isocalendar() 每次都要构造结果对象，按日期缓存"""
+    return datetime(year, month, day).isocalendar()[1]
+
+
+@lru_cache(maxsize=4096)
+def _date_keys(year: int, month: int, day: int) -> Tuple[str, str, str, str]:
+    """某一天的 (年, 月, 周, 日) 各级key；只依赖日期，按日期缓存"""
+    year_key = f"{year}"
+    month_key = f"{year_key}-{month:02d}"
+    week = _iso_week(year, month, day)
+    return year_key, month_key, f"{year_key}-W{week:02d}", f"{month_key}-{day:02d}"
+
+
+def effective_importance_array(memories: List[MemoryNode]):
+    """
+    按列计算有效重要度，与逐条调用 calculate_effective_importance 的结果完全相同（float64）
+    
+    没有 numpy 时返回 None
+    """
+    if np is None:
+        return None
+    importance = np.array([m.base_importance for m in memories], dtype=np.float64)
+    strength = np.array([m.current_strength for m in memories], dtype=np.float64)
+    mentions = np.array([m.mention_count for m in memories], dtype=np.float64)
+    mention_bonus = np.minimum(MAX_MENTION_BONUS, mentions * 0.05)
+    return np.minimum(1.0, importance * strength + mention_bonus)
+
+
+# 近期日期环形缓冲的槽数（2的幂，取模用按位与）
+_RECENT_DAY_SLOTS = 64
+
+
+def _locked(method):
+    """方法执行期间持有树级锁"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class TemporalMemoryTree:
@@ -40,21 +160,72 @@ class TemporalMemoryTree:
         
         # 根节点（虚拟）
         self.root_children: List[str] = []        # 年份节点列表
+        
+        # 事件节点的列式（SoA）视图：行号 -> 节点，按插入顺序
+        # timestamp 插入后不变，按行缓存；其余字段可能被直接修改，取列时重新读取
+        self._event_rows: List[MemoryNode] = []
+        self._event_timestamps: List[float] = []
+        self._event_timestamp_array = None        # _event_timestamps 的 ndarray 缓存
+        self._synced_node_count = 0               # 上次确认事件行有效时 nodes 的大小
+        
+        # 日期key -> 日节点对象，与 day_index 同步维护，热路径上省去一次 nodes 查找
+        self._day_nodes: Dict[str, MemoryNode] = {}
+        
+        # 近期日期的环形缓冲：槽位 = 日序数 % 槽数，存 (日序数, 日节点)；
+        # 命中时不必构造日期key，未命中再查 _day_nodes 并覆盖该槽
+        self._recent_days: List[Optional[Tuple[int, MemoryNode]]] = [None] * _RECENT_DAY_SLOTS
+        
+        # 已排序的年份/日期key，与 year_index / day_index 同步维护
+        self._sorted_years: List[str] = []
+        self._sorted_days: List[str] = []
+        
+        # 内容搜索的倒排索引：小写文本的相邻二字 -> 事件ID集合
+        # 只增不删，命中后仍逐条核对子串，残留的旧条目不影响结果
+        self._bigram_index: Dict[str, set] = defaultdict(set)
+        self._event_seq: Dict[str, int] = {}      # 事件ID -> 插入序号（搜索结果按插入顺序排）
+        self._event_counter = itertools.count()
+        
+        # get_tree_view 的月视图缓存：(月节点ID, 粒度, 是否展开, 阈值) -> 视图字典
+        # 树内的修改路径会清空它；nodes 大小变化（外部直接增删节点）时也会清空
+        self._view_cache: Dict[tuple, Dict[str, Any]] = {}
+        self._view_cache_node_count = 0
+        
+        # 树外修改的次数（invalidate_views 递增）；日摘要堆等增量结构据此判断是否需要重建
+        self._revision = 0
+        
+        # insert_without_summary 插入后待重建摘要的日节点（有序去重）
+        self._pending_summary_days: Dict[str, None] = {}
+        
+        # 树级锁：插入会同时改动层级、事件行、倒排索引和摘要，读取也依赖这些结构的一致性，
+        # 读写方法都经 _locked 持有它；可重入，方法之间可以互相调用
+        self._lock = threading.RLock()
     
     def _get_time_keys(self, dt: datetime) -> Dict[str, str]:
         """获取时间的各级key"""
+        year_key, month_key, week_key, day_key = _date_keys(dt.year, dt.month, dt.day)
         return {
-            "year": dt.strftime("%Y"),
-            "month": dt.strftime("%Y-%m"),
-            "week": f"{dt.year}-W{dt.isocalendar()[1]:02d}",
-            "day": dt.strftime("%Y-%m-%d")
+            "year": year_key,
+            "month": month_key,
+            "week": week_key,
+            "day": day_key
         }
     
-    def _ensure_time_hierarchy(self, dt: datetime) -> str:
+    def _ensure_day_node(self, dt: datetime) -> MemoryNode:
         """
-        确保时间层级存在，返回日节点ID
+        确保时间层级存在，返回日节点
         如果不存在则创建
         """
+        # 日节点已存在时上级节点必然存在，直接返回
+        ordinal = dt.toordinal()
+        slot = ordinal & (_RECENT_DAY_SLOTS - 1)
+        entry = self._recent_days[slot]
+        if entry is not None and entry[0] == ordinal:
+            return entry[1]
+        day_node = self._day_nodes.get(_date_keys(dt.year, dt.month, dt.day)[3])
+        if day_node is not None:
+            self._recent_days[slot] = (ordinal, day_node)
+            return day_node
+        
         keys = self._get_time_keys(dt)
         
         # 确保年节点
@@ -67,6 +238,7 @@ class TemporalMemoryTree:
             self.nodes[year_node.id] = year_node
             self.year_index[keys["year"]] = year_node.id
             self.root_children.append(year_node.id)
+            bisect.insort(self._sorted_years, keys["year"])
         
         year_id = self.year_index[keys["year"]]
         
@@ -79,21 +251,24 @@ class TemporalMemoryTree:
                 parent_id=year_id
             )
             self.nodes[month_node.id] = month_node
+            month_node._label = month_node.timestamp.strftime("%Y年%m月")
             self.month_index[keys["month"]] = month_node.id
             self.nodes[year_id].children_ids.append(month_node.id)
         
         month_id = self.month_index[keys["month"]]
         
-        # 确保周节点
+        # 确保周节点（视图标签在创建时生成一次）
         if keys["week"] not in self.week_index:
             # 计算这周的开始日期
             week_start = dt - timedelta(days=dt.weekday())
+            week_number = _iso_week(dt.year, dt.month, dt.day)
             week_node = MemoryNode(
                 time_grain="week",
                 timestamp=week_start,
-                content=f"{dt.year}年第{dt.isocalendar()[1]}周的记忆",
+                content=f"{dt.year}年第{week_number}周的记忆",
                 parent_id=month_id
             )
+            week_node._label = f"第{week_number}周"
             self.nodes[week_node.id] = week_node
             self.week_index[keys["week"]] = week_node.id
             self.nodes[month_id].children_ids.append(week_node.id)
@@ -109,11 +284,18 @@ class TemporalMemoryTree:
                 parent_id=week_id
             )
             self.nodes[day_node.id] = day_node
+            day_node._label = day_node.timestamp.strftime("%m月%d日")
             self.day_index[keys["day"]] = day_node.id
+            bisect.insort(self._sorted_days, keys["day"])
             self.nodes[week_id].children_ids.append(day_node.id)
+        else:
+            day_node = self.nodes[self.day_index[keys["day"]]]
         
-        return self.day_index[keys["day"]]
+        self._day_nodes[keys["day"]] = day_node
+        self._recent_days[slot] = (ordinal, day_node)
+        return day_node
     
+    @_locked
     def add_memory(self, memory: MemoryNode) -> str:
         """
         添加一条记忆到树中
@@ -124,54 +306,276 @@ class TemporalMemoryTree:
         Returns:
             记忆节点ID
         """
+        day_id = self._insert_event(memory)
+        
+        # 更新日节点的摘要
+        self._update_day_summary(day_id, memory)
+        
+        return memory.id
+    
+    @_locked
+    def add_memories(self, memories: List[MemoryNode]) -> List[str]:
+        """
+        批量添加记忆，每个涉及的日节点只在最后重建一次摘要
+        
+        Returns:
+            记忆节点ID列表
+        """
+        day_ids = {self._insert_event(memory): None for memory in memories}
+        for day_id in day_ids:
+            self._update_day_summary(day_id)
+        return [memory.id for memory in memories]
+    
+    @_locked
+    def insert_without_summary(self, memory: MemoryNode) -> str:
+        """
+        添加记忆但暂不更新日节点摘要，用于流式导入；导入结束后调用 optimize()
+        
+        Returns:
+            记忆节点ID
+        """
+        self._pending_summary_days[self._insert_event(memory)] = None
+        return memory.id
+    
+    @_locked
+    def optimize(self):
+        """为 insert_without_summary 涉及的日节点重建摘要"""
+        pending, self._pending_summary_days = self._pending_summary_days, {}
+        for day_id in pending:
+            if day_id in self.nodes:
+                self._update_day_summary(day_id)
+    
+    def _insert_event(self, memory: MemoryNode) -> str:
+        """把事件挂到对应日节点下并登记到事件行，返回日节点ID"""
+        # 事件行此前与 nodes 一致时，本次插入后仍一致
+        rows_synced = self._synced_node_count == len(self.nodes)
+        self._view_cache.clear()
+        
         # 确保时间层级存在
-        day_id = self._ensure_time_hierarchy(memory.timestamp)
+        day_node = self._ensure_day_node(memory.timestamp)
+        day_id = day_node.id
         
         # 设置父节点为日节点
         memory.parent_id = day_id
         memory.time_grain = "event"
         
+        # 同一ID再次插入（含被外部删除后重加）时先去掉旧的事件行，保证每个ID只有一行
+        if memory.id in self._event_seq:
+            self._drop_event_row(memory.id)
+        
         # 存储
         self.nodes[memory.id] = memory
-        self.nodes[day_id].children_ids.append(memory.id)
+        day_node.children_ids.append(memory.id)
+        self._event_rows.append(memory)
+        self._event_timestamps.append(epoch_seconds(memory.timestamp))
+        self._event_timestamp_array = None
+        self._synced_node_count = len(self.nodes) if rows_synced else -1
         
-        # 更新日节点的摘要
-        self._update_day_summary(day_id)
+        self._raise_max_importance(day_id, memory.base_importance)
         
-        return memory.id
+        self._event_seq.pop(memory.id, None)
+        self._event_seq[memory.id] = next(self._event_counter)
+        self._index_text(memory)
+        
+        return day_id
     
-    def _update_day_summary(self, day_id: str):
-        """更新日节点的摘要"""
+    def _drop_event_row(self, memory_id: str):
+        """删除某ID的事件行及其时间戳"""
+        rows = self._event_rows
+        keep = [i for i, node in enumerate(rows) if node.id != memory_id]
+        if len(keep) != len(rows):
+            self._event_rows = [rows[i] for i in keep]
+            self._event_timestamps = [self._event_timestamps[i] for i in keep]
+            self._event_timestamp_array = None
+    
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        """文本中所有相邻二字"""
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+    
+    def _index_text(self, memory: MemoryNode):
+        """把事件的 content / detail 登记到倒排索引"""
+        index = self._bigram_index
+        for gram in self._bigrams(memory.content_lc) | self._bigrams(memory.detail_lc):
+            index[gram].add(memory.id)
+    
+    def _raise_max_importance(self, node_id: Optional[str], importance: float):
+        """沿父链向上更新子树最大重要度，遇到已不小于 importance 的祖先即停止"""
+        while node_id is not None:
+            node = self.nodes.get(node_id)
+            if node is None or node._max_descendant_importance >= importance:
+                return
+            node._max_descendant_importance = importance
+            node_id = node.parent_id
+    
+    @_locked
+    def refresh_importance(self, memory_id: str):
+        """事件的 base_importance 被修改后调用，保证视图剪枝不会漏掉它"""
+        self.invalidate_views()
+        node = self.nodes.get(memory_id)
+        if node is not None and node.time_grain == "event":
+            self._raise_max_importance(node.parent_id, node.base_importance)
+    
+    @_locked
+    def reindex_memory(self, memory_id: str):
+        """事件的 content / detail 被直接修改后调用，使内容搜索能匹配到新文本"""
+        self.invalidate_views()
+        node = self.nodes.get(memory_id)
+        if node is not None and node.time_grain == "event":
+            self._index_text(node)
+    
+    def _update_day_summary(self, day_id: str, new_event: Optional[MemoryNode] = None):
+        """
+        更新日节点的摘要
+        
+        日节点上保留有效重要度前3的事件堆；new_event 是刚追加到末尾的事件、
+        建堆后树外没有修改过节点（invalidate_views）且堆内重要度未变时只把它压入堆，
+        否则按全部事件重建
+        """
         day_node = self.nodes[day_id]
-        events = [self.nodes[cid] for cid in day_node.children_ids]
-        
-        if events:
-            # 按重要度排序，取top事件生成摘要
-            top_events = sorted(
-                events, 
-                key=lambda x: x.calculate_effective_importance(), 
-                reverse=True
-            )[:3]
-            
-            summaries = [e.content for e in top_events]
-            day_node.content = "；".join(summaries)
+        children = day_node.children_ids
+        if not children:
+            return
+        
+        heap = day_node._top_events
+        if (
+            new_event is not None
+            and heap is not None
+            and day_node._summarized_children == len(children) - 1
+            and day_node._summary_revision == self._revision
+            and all(
+                eid in self.nodes and self.nodes[eid].calculate_effective_importance() == importance
+                for importance, _, eid in heap
+            )
+        ):
+            entry = (new_event.calculate_effective_importance(), 1 - len(children), new_event.id)
+            if len(heap) < 3:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heappushpop(heap, entry)
+            day_node.base_importance = max(day_node.base_importance, new_event.base_importance)
+        else:
+            # 重要度相同时先加入的事件优先，与稳定排序一致
+            events = [self.nodes[cid] for cid in children]
+            heap = heapq.nlargest(3, (
+                (event.calculate_effective_importance(), -i, event.id)
+                for i, event in enumerate(events)
+            ))
+            heapq.heapify(heap)
+            day_node._top_events = heap
             day_node.base_importance = max(e.base_importance for e in events)
+        day_node._summarized_children = len(children)
+        day_node._summary_revision = self._revision
+        
+        summaries = [self.nodes[eid].content for _, _, eid in sorted(heap, reverse=True)]
+        day_node.content = "；".join(summaries)
+    
+    @_locked
+    def _sync_event_rows(self) -> List[MemoryNode]:
+        """
+        剔除已不在 nodes 中的事件行（节点可能被外部直接删除）
+        
+        nodes 大小与上次确认时相同则跳过逐行检查
+        """
+        nodes = self.nodes
+        rows = self._event_rows
+        if self._synced_node_count == len(nodes):
+            return rows
+        self._synced_node_count = len(nodes)
+        if any(nodes.get(node.id) is not node for node in rows):
+            keep = [i for i, node in enumerate(rows) if nodes.get(node.id) is node]
+            self._event_rows = [rows[i] for i in keep]
+            self._event_timestamps = [self._event_timestamps[i] for i in keep]
+            self._event_timestamp_array = None
+        return self._event_rows
+    
+    @_locked
+    def get_event_memories(self) -> List[MemoryNode]:
+        """获取所有事件记忆（按插入顺序）"""
+        return list(self._sync_event_rows())
+    
+    @_locked
+    def count_event_memories(self) -> int:
+        """事件记忆条数，不复制列表"""
+        return len(self._sync_event_rows())
+    
+    @_locked
+    def get_year_span(self) -> Optional[Tuple[str, str]]:
+        """最早和最晚的年份key；没有记忆时返回 None"""
+        years = self._sorted_keys(self.year_index, self._sorted_years)
+        if not years:
+            return None
+        return years[0], years[-1]
+    
+    @staticmethod
+    def _sorted_keys(index: Dict[str, str], sorted_keys: List[str]) -> List[str]:
+        """返回与 index 同步的有序key列表；index 被整体替换过（如 load）时就地重新排序"""
+        if len(sorted_keys) != len(index):
+            sorted_keys[:] = sorted(index)
+        return sorted_keys
+    
+    @_locked
+    def get_event_columns(self) -> Optional[Dict[str, Any]]:
+        """
+        事件记忆的列式视图，供批量计算使用；没有 numpy 时返回 None
+        
+        Returns:
+            {"rows": 行号 -> 节点（与各列同一时刻的副本）,
+             "timestamp_s" / "last_reinforced_s": 秒数（见 epoch_seconds）,
+             "importance" (float32), "mentions" / "emotions" (int32),
+             "is_consolidated": 各行字段}
+            时间列保持 float64，秒级时间戳在 float32 下会丢失精度
+        """
+        if np is None:
+            return None
+        
+        # 复制一份，之后的插入不会让 rows 与各列长度不一致
+        rows = list(self._sync_event_rows())
+        if self._event_timestamp_array is None:
+            self._event_timestamp_array = np.array(self._event_timestamps, dtype=np.float64)
+        
+        return {
+            "rows": rows,
+            "timestamp_s": self._event_timestamp_array,
+            "importance": np.array([m.base_importance for m in rows], dtype=np.float32),
+            "mentions": np.array([m.mention_count for m in rows], dtype=np.int32),
+            "emotions": np.array([len(m.emotion_tags) for m in rows], dtype=np.int32),
+            "last_reinforced_s": np.array(
+                [epoch_seconds(m.last_mentioned or m.created_at) for m in rows],
+                dtype=np.float64
+            ),
+            "is_consolidated": np.array([m.is_consolidated for m in rows], dtype=np.bool_),
+        }
     
     def get_memory(self, memory_id: str) -> Optional[MemoryNode]:
         """获取指定记忆"""
         return self.nodes.get(memory_id)
     
+    @_locked
     def get_day_memories(self, date: datetime) -> List[MemoryNode]:
         """获取某天的所有记忆"""
-        day_key = date.strftime("%Y-%m-%d")
-        if day_key not in self.day_index:
-            return []
-        
-        day_id = self.day_index[day_key]
-        day_node = self.nodes[day_id]
+        ordinal = date.toordinal()
+        slot = ordinal & (_RECENT_DAY_SLOTS - 1)
+        entry = self._recent_days[slot]
+        if entry is not None and entry[0] == ordinal:
+            day_node = entry[1]
+        else:
+            day_node = self._day_node(_date_keys(date.year, date.month, date.day)[3])
+            if day_node is None:
+                return []
+            self._recent_days[slot] = (ordinal, day_node)
         
         return [self.nodes[cid] for cid in day_node.children_ids]
     
+    def _day_node(self, day_key: str) -> Optional[MemoryNode]:
+        """按日期key取日节点，不存在时返回 None"""
+        day_node = self._day_nodes.get(day_key)
+        if day_node is None and day_key in self.day_index:
+            # day_index 被整体替换过（如 load）
+            day_node = self.nodes[self.day_index[day_key]]
+        return day_node
+    
+    @_locked
     def get_range_memories(
         self, 
         start: datetime, 
@@ -181,23 +585,43 @@ class TemporalMemoryTree:
         """
         获取时间范围内的记忆
         
+        按天取整，start 和 end 所在的日期都包含在内
+        
         Args:
             start: 开始时间
             end: 结束时间
             min_importance: 最低重要度阈值
         """
-        memories = []
-        current = start
+        if start > end:
+            return []
         
-        while current <= end:
-            day_memories = self.get_day_memories(current)
-            for mem in day_memories:
-                if mem.calculate_effective_importance() >= min_importance:
-                    memories.append(mem)
-            current += timedelta(days=1)
+        # 只遍历有记忆的日期："YYYY-MM-DD" 的字典序即时间顺序
+        nodes = self.nodes
+        days = self._sorted_keys(self.day_index, self._sorted_days)
+        lo = bisect.bisect_left(days, _date_keys(start.year, start.month, start.day)[3])
+        hi = bisect.bisect_right(days, _date_keys(end.year, end.month, end.day)[3])
+        memories = [
+            nodes[cid]
+            for day_key in days[lo:hi]
+            for cid in self._day_node(day_key).children_ids
+        ]
+        
+        importance = effective_importance_array(memories)
+        if importance is not None:
+            return [memories[i] for i in np.flatnonzero(importance >= min_importance).tolist()]
+        return [m for m in memories if m.calculate_effective_importance() >= min_importance]
+    
+    @_locked
+    def invalidate_views(self):
+        """
+        在树外直接修改节点字段（强度、重要度、标签等）后调用
         
-        return memories
+        清空树形视图缓存，并使日摘要堆在下次插入时按全部事件重建
+        """
+        self._view_cache.clear()
+        self._revision += 1
     
+    @_locked
     def get_tree_view(
         self, 
         grain: str = "month",
@@ -217,9 +641,17 @@ class TemporalMemoryTree:
             importance_threshold: 高重要度阈值
             
         Returns:
-            树形结构字典
+            树形结构字典；其中的月视图会被缓存复用，调用方不应修改
+        
+        缓存在经本树的方法插入记忆、节点数变化时自动失效。在树外修改节点字段的代码
+        （遗忘曲线强化、压缩等）须对所在的树调用 invalidate_views()，
+        改了 base_importance 则调用 refresh_importance()；MemoryManager 与压缩器已这样做
         """
         result = {"type": "root", "children": []}
+        if self._view_cache_node_count != len(self.nodes):
+            self._view_cache.clear()
+            self._view_cache_node_count = len(self.nodes)
+        view_cache = self._view_cache
         
         # 确定要展示的年份
         years_to_show = [year] if year else [int(y) for y in self.year_index.keys()]
@@ -249,9 +681,13 @@ class TemporalMemoryTree:
                     if month and month_node.timestamp.month != month:
                         continue
                     
-                    month_view = self._build_month_view(
-                        month_node, grain, expand_important, importance_threshold
-                    )
+                    cache_key = (month_id, grain, expand_important, importance_threshold)
+                    month_view = view_cache.get(cache_key)
+                    if month_view is None:
+                        month_view = self._build_month_view(
+                            month_node, grain, expand_important, importance_threshold
+                        )
+                        view_cache[cache_key] = month_view
                     year_view["children"].append(month_view)
             
             result["children"].append(year_view)
@@ -268,7 +704,7 @@ class TemporalMemoryTree:
         """构建月视图"""
         month_view = {
             "type": "month",
-            "label": month_node.timestamp.strftime("%Y年%m月"),
+            "label": month_node._label,
             "id": month_node.id,
             "importance": month_node.base_importance,
             "children": []
@@ -303,7 +739,7 @@ class TemporalMemoryTree:
         """构建周视图"""
         week_view = {
             "type": "week",
-            "label": f"第{week_node.timestamp.isocalendar()[1]}周",
+            "label": week_node._label,
             "id": week_node.id,
             "importance": week_node.base_importance,
             "children": []
@@ -340,7 +776,7 @@ class TemporalMemoryTree:
         
         return {
             "type": "day",
-            "label": day_node.timestamp.strftime("%m月%d日"),
+            "label": day_node._label,
             "id": day_node.id,
             "importance": day_node.base_importance,
             "events": sorted(events, key=lambda x: x["importance"], reverse=True)
@@ -351,26 +787,34 @@ class TemporalMemoryTree:
         parent_node: MemoryNode, 
         threshold: float
     ) -> List[Dict[str, Any]]:
-        """递归获取高重要度事件"""
+        """
+        获取子树中的高重要度事件
+        
+        有效重要度不超过 base_importance + MAX_MENTION_BONUS，
+        子树最大 base_importance 加上该上限仍低于阈值时整棵子树跳过
+        """
         important = []
+        nodes = self.nodes
         
-        def traverse(node_id: str):
-            node = self.nodes[node_id]
+        # 显式栈，子节点逆序入栈以保持与递归相同的先序遍历顺序
+        stack = [parent_node.id]
+        while stack:
+            node = nodes[stack.pop()]
             if node.time_grain == "event":
-                if node.calculate_effective_importance() >= threshold:
+                importance = node.calculate_effective_importance()
+                if importance >= threshold:
                     important.append({
                         "id": node.id,
                         "content": node.content,
-                        "importance": node.calculate_effective_importance(),
-                        "timestamp": node.timestamp.isoformat()
+                        "importance": importance,
+                        "timestamp": node.timestamp_iso
                     })
-            else:
-                for child_id in node.children_ids:
-                    traverse(child_id)
+            elif node._max_descendant_importance + MAX_MENTION_BONUS >= threshold:
+                stack.extend(reversed(node.children_ids))
         
-        traverse(parent_node.id)
         return sorted(important, key=lambda x: x["importance"], reverse=True)
     
+    @_locked
     def search_by_content(
         self, 
         query: str,
@@ -380,26 +824,56 @@ class TemporalMemoryTree:
         """
         简单的内容搜索
         实际使用中应该接入向量数据库
+        
+        查询不短于两个字时先用二字倒排索引取候选，再逐条核对子串
         """
         results = []
+        query_lc = query.lower()
+        candidates = self._content_candidates(query_lc)
+        
+        # 先按有效重要度整列过滤，只对留下的节点做子串匹配
+        importance = effective_importance_array(candidates)
+        if importance is not None:
+            keep = np.flatnonzero(importance >= min_importance)
+            scored = zip([candidates[i] for i in keep.tolist()], importance[keep].tolist())
+        else:
+            scored = [(node, node.calculate_effective_importance()) for node in candidates]
+            scored = [(node, imp) for node, imp in scored if imp >= min_importance]
         
-        for node in self.nodes.values():
-            if node.time_grain != "event":
-                continue
-            
-            if node.calculate_effective_importance() < min_importance:
-                continue
-            
-            # 简单的关键词匹配
-            if query.lower() in node.content.lower():
-                results.append(node)
-            elif node.detail and query.lower() in node.detail.lower():
-                results.append(node)
+        for node, node_importance in scored:
+            # 简单的关键词匹配（节点上缓存了小写文本）
+            if query_lc in node.content_lc:
+                results.append((node, node_importance))
+            elif node.detail and query_lc in node.detail_lc:
+                results.append((node, node_importance))
         
         # 按重要度排序
-        results.sort(key=lambda x: x.calculate_effective_importance(), reverse=True)
+        results.sort(key=lambda x: x[1], reverse=True)
         
-        return results[:limit]
+        return [node for node, _ in results[:limit]]
+    
+    def _content_candidates(self, query_lc: str):
+        """可能包含 query_lc 的事件，按插入顺序；查询太短无法用索引时返回全部事件"""
+        if len(query_lc) < 2:
+            return self.get_event_memories()
+        
+        # 从最短的倒排表开始求交集
+        postings = sorted(
+            (self._bigram_index.get(gram, ()) for gram in self._bigrams(query_lc)),
+            key=len
+        )
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            if not candidates:
+                break
+            candidates &= ids
+        
+        nodes = self.nodes
+        return [
+            nodes[memory_id]
+            for memory_id in sorted(candidates, key=self._event_seq.__getitem__)
+            if memory_id in nodes and nodes[memory_id].time_grain == "event"
+        ]
     
     def search_by_time_and_topic(
         self,
@@ -425,10 +899,11 @@ class TemporalMemoryTree:
         
         # 如果有话题，进一步过滤
         if topic:
+            topic_lc = topic.lower()
             memories = [
                 m for m in memories 
-                if topic.lower() in m.content.lower() or
-                   any(topic.lower() in tag.lower() for tag in m.topic_tags)
+                if topic_lc in m.content_lc or
+                   any(topic_lc in tag.lower() for tag in m.topic_tags)
             ]
         
         return memories
@@ -443,39 +918,41 @@ class TemporalMemoryTree:
             # 默认返回最近一周
             return ref - timedelta(days=7), ref
         
-        hint = hint.lower()
-        
-        if "昨天" in hint or "昨晚" in hint:
-            yesterday = ref - timedelta(days=1)
-            return datetime(yesterday.year, yesterday.month, yesterday.day), \
-                   datetime(yesterday.year, yesterday.month, yesterday.day, 23, 59, 59)
-        
-        if "前天" in hint:
-            day = ref - timedelta(days=2)
-            return datetime(day.year, day.month, day.day), \
-                   datetime(day.year, day.month, day.day, 23, 59, 59)
-        
-        if "上周" in hint:
-            start = ref - timedelta(days=ref.weekday() + 7)
-            end = start + timedelta(days=6)
-            return start, end
-        
-        if "上个月" in hint or "上月" in hint:
-            first_of_month = datetime(ref.year, ref.month, 1)
-            last_month_end = first_of_month - timedelta(days=1)
-            last_month_start = datetime(last_month_end.year, last_month_end.month, 1)
-            return last_month_start, last_month_end
-        
-        if "去年" in hint:
-            return datetime(ref.year - 1, 1, 1), datetime(ref.year - 1, 12, 31)
+        # 一次正则扫描找出所有时间词，多个时取优先级最高的（与原先逐个判断的顺序一致）
+        matches = _TIME_HINT_RE.findall(hint)
+        if matches:
+            handler = min(
+                (_TIME_HINT_DISPATCH[word] for word in matches),
+                key=_TIME_HINT_PRIORITY.__getitem__
+            )
+            return handler(ref)
         
         # 默认最近一周
         return ref - timedelta(days=7), ref
     
-    def to_dict(self) -> Dict[str, Any]:
-        """序列化为字典"""
+    def iter_dict_items(self, include_raw: bool = False) -> Iterator[Tuple[str, Any]]:
+        """
+        to_dict 的流式版本，供逐项写文件使用
+        
+        "nodes" 的值是逐个产出 (节点ID, 节点字典) 的生成器
+        """
+        yield "nodes", ((k, v.to_dict(include_raw)) for k, v in self.nodes.items())
+        yield "year_index", self.year_index
+        yield "month_index", self.month_index
+        yield "week_index", self.week_index
+        yield "day_index", self.day_index
+        yield "root_children", self.root_children
+    
+    @_locked
+    def to_dict(self, include_raw: bool = False) -> Dict[str, Any]:
+        """
+        序列化为字典
+        
+        Args:
+            include_raw: 是否输出节点的原始对话（raw_conversation）
+        """
         return {
-            "nodes": {k: v.to_dict() for k, v in self.nodes.items()},
+            "nodes": {k: v.to_dict(include_raw) for k, v in self.nodes.items()},
             "year_index": self.year_index,
             "month_index": self.month_index,
             "week_index": self.week_index,
@@ -483,10 +960,15 @@ class TemporalMemoryTree:
             "root_children": self.root_children
         }
     
+    @_locked
     def save(self, filepath: str):
-        """保存到文件"""
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        """
+        保存到文件
+        
+        节点逐个序列化写出（有 orjson 时用其C实现），不先构建完整字典；输出不缩进
+        """
+        with open(filepath, 'wb') as f:
+            write_json_object(f, self.iter_dict_items())
     
     @classmethod
     def load(cls, filepath: str) -> 'TemporalMemoryTree':
@@ -6,7 +6,7 @@ setup(
     description="终身陪伴型Agent的记忆框架",
     author="Your Name",
     packages=find_packages(),
-    python_requires=">=3.8",
+    python_requires=">=3.10",
     install_requires=[
         # 基础依赖（纯Python实现，无额外依赖）
     ],
@@ -24,6 +24,8 @@ setup(
             "faiss-cpu",
             "openai",
             "anthropic",
+            "orjson",  # 更快的JSON序列化
+            "numba",  # 遗忘曲线批量计算内核
         ]
     }
 )
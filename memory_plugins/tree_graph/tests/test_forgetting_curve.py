@@ -0,0 +1,61 @@
+"""
+遗忘曲线的回归测试
+"""
+
+import random
+from datetime import datetime, timedelta
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema.models import MemoryNode
+from core.forgetting_curve import ForgettingCurve, np
+
+
+def _random_memories(count: int = 500):
+    rng = random.Random(7)
+    base = datetime(2024, 1, 1)
+    return [
+        MemoryNode(
+            content=f"记忆{i}",
+            timestamp=base + timedelta(hours=rng.randrange(24 * 365)),
+            base_importance=rng.random(),
+            mention_count=rng.randrange(20),
+            emotion_tags=["开心"] * rng.randrange(4),
+            created_at=base + timedelta(hours=rng.randrange(24 * 365)),
+        )
+        for i in range(count)
+    ]
+
+
+def test_retention_kernel_matches_numpy_path():
+    if np is None:
+        return
+    from core._forgetting_kernels import retention_kernel, _retention_numpy
+
+    rng = np.random.default_rng(7)
+    count = 1000
+    args = (
+        rng.random(count).astype(np.float32),
+        rng.integers(0, 50, count).astype(np.int32),
+        rng.integers(0, 5, count).astype(np.int32),
+        rng.uniform(-5, 400, count),
+    )
+    constants = (0.5, 0.2, 0.1)
+
+    assert np.allclose(retention_kernel(*args, *constants), _retention_numpy(*args, *constants),
+                       rtol=0, atol=1e-12)
+
+
+def test_batch_retention_matches_per_memory():
+    curve = ForgettingCurve()
+    memories = _random_memories()
+    now = datetime(2025, 1, 1)
+
+    batch = curve.batch_calculate_retention(memories, now)
+    single = [curve.calculate_retention(memory, now) for memory in memories]
+
+    # 批量路径的重要度列为 float32
+    assert max(abs(a - b) for a, b in zip(batch, single)) < 1e-6
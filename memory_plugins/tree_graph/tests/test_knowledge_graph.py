@@ -0,0 +1,38 @@
+"""
+知识图谱的回归测试
+"""
+
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema.models import EntityType
+from schema.knowledge_graph import KnowledgeGraph
+
+
+def _important_names(graph: KnowledgeGraph, k: int):
+    return [person.name for person in graph._get_top_people(k)]
+
+
+def test_top_people_follow_importance_updates():
+    graph = KnowledgeGraph("u")
+    people = [graph.get_or_create_entity(f"P{i}", EntityType.PERSON) for i in range(5)]
+    for i, person in enumerate(people):
+        person.importance = 0.1 * i
+    assert _important_names(graph, 2) == ["P4", "P3"]
+
+    # 堆外人物的重要度上升：经 update_entity 和直接赋值两种途径
+    graph.update_entity(people[0].id, {"importance": 0.9})
+    people[1].importance = 0.8
+    assert _important_names(graph, 2) == ["P0", "P1"]
+    assert "P0" in graph.get_context_summary(max_entities=2)
+
+
+def test_top_people_ties_keep_insertion_order():
+    graph = KnowledgeGraph("u")
+    for i in range(4):
+        graph.get_or_create_entity(f"P{i}", EntityType.PERSON).importance = 0.5
+
+    assert _important_names(graph, 3) == ["P0", "P1", "P2"]
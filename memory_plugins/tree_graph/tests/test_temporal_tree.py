@@ -0,0 +1,240 @@
+"""
+时间记忆树的回归测试
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema.models import MemoryNode
+from schema.temporal_tree import TemporalMemoryTree
+from schema.knowledge_graph import KnowledgeGraph
+from core.forgetting_curve import ForgettingCurve
+from core.consolidation import MemoryConsolidator, ConsolidationConfig
+
+
+def _make_tree(count: int = 5):
+    tree = TemporalMemoryTree()
+    base = datetime(2024, 3, 1, 9)
+    memories = [
+        MemoryNode(content=f"记忆{i}", timestamp=base + timedelta(days=i), base_importance=0.1)
+        for i in range(count)
+    ]
+    for memory in memories:
+        tree.add_memory(memory)
+    return tree, memories
+
+
+def test_readd_existing_id_keeps_one_row():
+    tree, memories = _make_tree()
+    tree.add_memory(memories[2])
+
+    assert tree.count_event_memories() == 5
+    assert sorted(m.id for m in tree.get_event_memories()) == sorted(m.id for m in memories)
+
+
+def test_readd_after_direct_delete_keeps_one_row():
+    tree, memories = _make_tree()
+    target = memories[1]
+    # 后端的删除方式：从父节点摘除后直接删 nodes
+    tree.nodes[target.parent_id].children_ids.remove(target.id)
+    del tree.nodes[target.id]
+    tree.add_memory(target)
+
+    assert tree.count_event_memories() == 5
+
+
+def test_consolidate_after_readd():
+    tree, memories = _make_tree()
+    tree.add_memory(memories[0])
+    consolidator = MemoryConsolidator(tree, KnowledgeGraph("u"), ForgettingCurve())
+
+    report = asyncio.run(consolidator.consolidate(datetime(2024, 6, 1)))
+
+    assert report["stats"]["total_memories"] == 5
+
+
+
+def test_consolidate_with_duplicate_rows():
+    tree, memories = _make_tree()
+    # 事件行与ID不一一对应时（如同一节点出现两行），清理掩码仍须按行对齐
+    tree._event_rows.append(memories[0])
+    tree._event_timestamps.append(tree._event_timestamps[0])
+    tree._event_timestamp_array = None
+    consolidator = MemoryConsolidator(tree, KnowledgeGraph("u"), ForgettingCurve())
+
+    report = asyncio.run(consolidator.consolidate(datetime(2024, 6, 1)))
+
+    assert report["stats"]["total_memories"] == 6
+
+
+def test_range_with_inverted_bounds_is_empty():
+    tree, _ = _make_tree()
+    day = datetime(2024, 3, 2)
+
+    assert tree.get_range_memories(day.replace(hour=23), day.replace(hour=1)) == []
+    assert len(tree.get_range_memories(day.replace(hour=1), day.replace(hour=23))) == 1
+
+
+def test_tree_view_reflects_reinforcement():
+    tree, memories = _make_tree()
+    other_tree, _ = _make_tree()
+    curve = ForgettingCurve()
+    before = tree.get_tree_view("day", importance_threshold=0.3)
+    other_tree.get_tree_view("day", importance_threshold=0.3)
+
+    # 与 MemoryManager.reinforce_memory 相同：遗忘曲线修改记忆后通知所在的树
+    target = memories[3]
+    target.base_importance = 0.9
+    curve.reinforce_memory(target, datetime(2024, 3, 5))
+    tree.refresh_importance(target.id)
+    after = tree.get_tree_view("day", importance_threshold=0.3)
+
+    tree.invalidate_views()
+    for node in tree.nodes.values():
+        node._max_descendant_importance = 1.0
+    assert after == tree.get_tree_view("day", importance_threshold=0.3)
+    assert after != before
+    # 其他树的缓存不受影响
+    assert other_tree._view_cache
+
+
+def test_event_columns_are_a_snapshot():
+    tree, _ = _make_tree()
+    columns = tree.get_event_columns()
+    if columns is None:  # 没有 numpy
+        return
+    tree.add_memory(MemoryNode(content="新记忆", timestamp=datetime(2024, 3, 9)))
+
+    assert len(columns["rows"]) == len(columns["timestamp_s"]) == len(columns["importance"]) == 5
+
+
+def test_consolidate_with_concurrent_insert():
+    tree, _ = _make_tree()
+    consolidator = MemoryConsolidator(tree, KnowledgeGraph("u"), ForgettingCurve())
+
+    async def insert_during_summaries():
+        tree.add_memory(MemoryNode(content="新记忆", timestamp=datetime(2024, 3, 9)))
+
+    async def run():
+        return await asyncio.gather(
+            consolidator.consolidate(datetime(2024, 6, 1)), insert_during_summaries()
+        )
+
+    report, _ = asyncio.run(run())
+
+    assert report["stats"]["total_memories"] == 5
+    assert tree.count_event_memories() == 6
+
+
+def test_day_summary_sees_importance_raised_outside_top_three():
+    tree = TemporalMemoryTree()
+    day = datetime(2024, 3, 1)
+    events = [
+        MemoryNode(content=f"e{i}", timestamp=day.replace(hour=8 + i), base_importance=importance)
+        for i, importance in enumerate([0.9, 0.8, 0.5, 0.3])
+    ]
+    for event in events:
+        tree.add_memory(event)
+
+    # 堆外的 e3 重要度升过 e2，按约定通知树
+    events[3].base_importance = 0.7
+    tree.refresh_importance(events[3].id)
+    tree.add_memory(MemoryNode(content="e4", timestamp=day.replace(hour=20), base_importance=0.1))
+
+    day_node = tree.nodes[events[0].parent_id]
+    assert day_node.content == "e0；e1；e3"
+
+
+def test_concurrent_readers_see_consistent_columns():
+    tree, _ = _make_tree()
+    if tree.get_event_columns() is None:  # 没有 numpy
+        return
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        base = datetime(2024, 4, 1)
+        for i in range(10000):
+            tree.add_memory(MemoryNode(content=f"并发{i}", timestamp=base + timedelta(hours=i)))
+        done.set()
+
+    def reader():
+        while not done.is_set():
+            columns = tree.get_event_columns()
+            if not len(columns["rows"]) == len(columns["timestamp_s"]) == len(columns["importance"]):
+                errors.append(len(columns["rows"]))
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert tree.count_event_memories() == 10005
+
+
+def test_timezone_aware_timestamps():
+    tree, _ = _make_tree()
+    aware = datetime.fromisoformat("2024-03-02T10:00:00+08:00")
+    tree.add_memory(MemoryNode(content="带时区", timestamp=aware))
+
+    assert tree.count_event_memories() == 6
+    assert [m.content for m in tree.get_day_memories(aware)] == ["记忆1", "带时区"]
+    columns = tree.get_event_columns()
+    if columns is not None:
+        assert columns["timestamp_s"][-1] == aware.timestamp()
+
+
+def test_deferred_summaries_are_released_and_collected():
+    tree, _ = _make_tree()
+    consolidator = MemoryConsolidator(
+        tree, KnowledgeGraph("u"), ForgettingCurve(), ConsolidationConfig(defer_daily_summaries=True)
+    )
+
+    async def run():
+        report = await consolidator.consolidate(datetime(2024, 6, 1))
+        await asyncio.sleep(0.01)
+        # 已完成的任务不再留在列表中
+        pending = list(consolidator._summary_tasks)
+        return report, pending, await consolidator.wait_for_summaries()
+
+    report, pending, actions = asyncio.run(run())
+
+    assert report["deferred"] and pending == []
+    assert len(actions) == 5
+
+
+def test_failed_deferred_summary_is_logged():
+    tree, _ = _make_tree()
+    consolidator = MemoryConsolidator(
+        tree, KnowledgeGraph("u"), ForgettingCurve(), ConsolidationConfig(defer_daily_summaries=True)
+    )
+
+    async def failing_summaries(*args):
+        raise RuntimeError("摘要服务不可用")
+
+    consolidator._summarize_days = failing_summaries
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("core.consolidation")
+    logger.addHandler(handler)
+    try:
+        async def run():
+            await consolidator.consolidate(datetime(2024, 6, 1))
+            return await consolidator.wait_for_summaries()
+
+        assert asyncio.run(run()) == []
+    finally:
+        logger.removeHandler(handler)
+
+    assert len(records) == 1 and records[0].exc_info[0] is RuntimeError
+    assert consolidator._summary_tasks == []